@@ -14,7 +14,6 @@ try:
     import tkFileDialog as tkfd # python 2.7
 except:
     import tkinter.filedialog as tkfd # python 3
-import FEALinkModel
 
 class FEALinkStartCenter(Frame):
     def bringToFront(self): 
@@ -59,15 +58,18 @@ class FEALinkStartCenter(Frame):
         sys.exit()
 
     def new2dModel(self):
+        import FEALinkModel # the model window and its plotting libraries load when the first model opens
         self.Models[self.numModels] = FEALinkModel.Model(dimensions=2)
         self.numModels += 1
 
     def new3dModel(self):
+        import FEALinkModel
         self.Models[self.numModels] = FEALinkModel.Model(dimensions=3)
         self.numModels += 1
 
     def loadModel(self):
         filename = tkfd.askopenfilename()
+        import FEALinkModel
         self.Models[self.numModels] = FEALinkModel.Model(load=True,filename=filename)
         self.numModels += 1
 
@@ -80,9 +82,10 @@ class FEALinkStartCenter(Frame):
         self.Models = list()
         self.numModels = 0
 
-root = Tk()
-root.title("FEALink Start Center")
-root.geometry("200x120")
-startCenter = FEALinkStartCenter(master = root)
-startCenter.bringToFront()
-root.mainloop()
+if __name__ == '__main__':
+    root = Tk()
+    root.title("FEALink Start Center")
+    root.geometry("200x120")
+    startCenter = FEALinkStartCenter(master = root)
+    startCenter.bringToFront()
+    root.mainloop()
@@ -0,0 +1,128 @@
+# FEALinkBatch
+#
+# This module implements headless batch solving of saved models
+#
+# usage: python FEALinkBatch.py [-o OUTPUT] [-j PROCESSES] [--solver SOLVER] MODEL_OR_FOLDER [...]
+#
+# Every model file (folders are searched recursively) is loaded without a window, solved from scratch
+# in a pool of worker processes and written as OUTPUT/<model>.json, holding the displacements,
+# reactions, member strain, stress and tension of the nodal forces and of every load case.
+# OUTPUT/summary.json lists the status, size, solver and timings of all models.
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import FEALinkModel
+import FEALinkSolution
+
+def findModelFiles(paths): # model files with their output names, relative to the folder they were found in
+    jobs = list()
+    for path in paths:
+        if os.path.isdir(path):
+            for folder,subfolders,files in os.walk(path):
+                subfolders.sort()
+                for name in sorted(files):
+                    if name.startswith('.') or name.startswith('_') or name.endswith('.py') or name.endswith('.pyc'):
+                        continue # hidden, system and source files
+                    filename = os.path.join(folder,name)
+                    jobs.append((filename,os.path.relpath(filename,path)))
+        else:
+            jobs.append((path,os.path.basename(path)))
+    return jobs
+
+def getResultData(solution): # plain lists of the columnar results, keyed by node and link numbers
+    results = solution.results
+    data = dict()
+    data['nodes'] = results.nodeNumbers.tolist()
+    data['links'] = results.linkNumbers.tolist()
+    data['displacement'] = results.displacement.tolist()
+    data['reaction'] = results.reaction.tolist()
+    data['strain'] = results.strain.tolist()
+    data['stress'] = results.stress.tolist()
+    data['tension'] = results.tension.tolist()
+    data['maxStress'] = float(solution.maxStress)
+    data['minStress'] = float(solution.minStress)
+    data['totalLength'] = float(solution.totalLength)
+    data['totalMass'] = float(solution.totalMass)
+    data['loadCases'] = dict()
+    for name,result in solution.loadCaseResults.items(): # rows follow the same node and link numbers
+        data['loadCases'][name] = dict((key,values.tolist()) for key,values in result.items())
+    return data
+
+def solveModelFile(job): # loads, solves and writes one model, returns its summary entry
+    filename,outputName,outputFolder,solver = job
+    entry = {'model':filename,'output':None,'status':None,'timings':dict()}
+    start = time.time()
+    try:
+        model = FEALinkModel.Model(load=True,filename=filename,gui=False)
+    except Exception as error:
+        entry['status'] = "Load Failed: " + str(error)
+        return entry
+    entry['timings']['load'] = time.time() - start
+
+    # saved solutions may be out of date or from an older version, so every model is solved from scratch
+    model._Solution = None
+    start = time.time()
+    entry['status'] = model.solveModel(solver)
+    entry['timings']['solve'] = time.time() - start
+    entry['nodes'] = len(model._Nodes)
+    entry['links'] = len(model._Links)
+    entry['loadCases'] = len(model._LoadCases)
+    if model._Solution is None:
+        return entry
+    entry['dofs'] = int(model._Solution.size)
+    entry['solver'] = model._Solution.solverChoice
+    entry['solverReason'] = model._Solution.solverReason
+
+    start = time.time()
+    output = os.path.join(outputFolder,outputName + '.json')
+    try:
+        if not os.path.isdir(os.path.dirname(output)):
+            os.makedirs(os.path.dirname(output))
+        with open(output,'w') as file:
+            json.dump(getResultData(model._Solution),file)
+        entry['output'] = output
+    except (IOError,OSError) as error:
+        entry['status'] = "Write Failed: " + str(error)
+    entry['timings']['write'] = time.time() - start
+    return entry
+
+def solveModelFiles(paths,outputFolder,processes=None,solver=None): # solves every model over a process pool
+    jobs = [(filename,outputName,outputFolder,solver) for filename,outputName in findModelFiles(paths)]
+    if not os.path.isdir(outputFolder):
+        os.makedirs(outputFolder)
+    start = time.time()
+    summary = list()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for entry in pool.imap_unordered(solveModelFile,jobs):
+            summary.append(entry)
+            print('%s: %s (%.3f s)' % (entry['model'],entry['status'],sum(entry['timings'].values())))
+    finally:
+        pool.close()
+        pool.join()
+    summary.sort(key=lambda entry: entry['model'])
+    with open(os.path.join(outputFolder,'summary.json'),'w') as file:
+        json.dump({'models':summary,'processes':processes or multiprocessing.cpu_count(),'time':time.time() - start},file,indent=1)
+    return summary
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Solve saved FEALink models without opening a window.")
+    parser.add_argument('paths',nargs='+',help="model files or folders of model files")
+    parser.add_argument('-o','--output',default='FEALinkResults',help="folder for the results and summary.json")
+    parser.add_argument('-j','--processes',type=int,default=None,help="worker processes, defaults to the number of cores")
+    parser.add_argument('--solver',choices=FEALinkSolution.Solution._solvers,default=None,help="linear solver, picked per model by default")
+    arguments = parser.parse_args(arguments)
+
+    summary = solveModelFiles(arguments.paths,arguments.output,arguments.processes,arguments.solver)
+    failed = [entry for entry in summary if entry['status'] != "Success"]
+    print('%d models solved, %d failed' % (len(summary) - len(failed),len(failed)))
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
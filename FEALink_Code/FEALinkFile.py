@@ -0,0 +1,336 @@
+# FEALinkFile
+#
+# This module implements the FEALink model file format
+#
+# usage: python FEALinkFile.py [-o OUTPUT] MODEL [...]
+#
+# A model file is a zip archive holding a JSON header (header.json) and one .npy member per array, so
+# numpy.load() can also open it as an .npz file.  Materials, nodes, links, constraints, forces and load
+# cases are stored as typed arrays in compressed members.  A solution is an optional set of columnar
+# result sections, stored uncompressed so they are mapped from the file instead of read into memory and
+# only the pages that are used get loaded.  Stiffness matrices and factorizations are never stored, the
+# next solve rebuilds them.
+#
+# Run as a script it converts models saved as pickles by older versions.  Without OUTPUT the files are
+# converted in place and the original is kept next to it as MODEL.pickle.
+
+import gc
+import io
+import os
+import sys
+import json
+import struct
+import shutil
+import zipfile
+import argparse
+import numpy as np
+import FEALinkMaterial
+import FEALinkNode
+import FEALinkLink
+import FEALinkScope
+import FEALinkSolution
+
+formatName = 'FEALink'
+formatVersion = 1 # raised whenever a reader of the previous version could misread a file
+
+# solution attributes rebuilt on load rather than stored with the other solution attributes
+_rebuiltAttributes = ['_Nodes','_Links','_LoadCases','nodeIndex','_Length','_Mass','results','_SolNodes','_SolLinks',
+                        'loadCaseResults','connectivity','graph','factor']
+_resultColumns = ['coordinates','displacement','reaction','position','exaggerated','strain','stress','tension']
+
+def isModelFile(filename): # true for the zip based format, false for pickled models
+    return zipfile.is_zipfile(str(filename))
+
+def getPlain(value): # numpy scalars as python numbers for the JSON header
+    if isinstance(value,np.generic):
+        return value.item()
+    raise TypeError("not a plain value")
+
+def writeArray(archive,name,array,compress=True):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer,np.ascontiguousarray(array),allow_pickle=False)
+    info = zipfile.ZipInfo(name + '.npy',date_time=(1980,1,1,0,0,0))
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    info.external_attr = 0o644 << 16
+    archive.writestr(info,buffer.getvalue())
+    return
+
+def readArray(archive,name):
+    return np.lib.format.read_array(io.BytesIO(archive.read(name + '.npy')),allow_pickle=False)
+
+def mapArray(archive,name): # copy-on-write memory map of an uncompressed member, compressed members are read
+    info = archive.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return readArray(archive,name)
+    with open(archive.filename,'rb') as file:
+        # the data follows the local file header, whose extra field can differ from the central directory's
+        file.seek(info.header_offset)
+        nameLength,extraLength = struct.unpack('<HH',file.read(30)[26:30])
+        file.seek(info.header_offset + 30 + nameLength + extraLength)
+        version = np.lib.format.read_magic(file)
+        if version == (1,0):
+            shape,fortran,dtype = np.lib.format.read_array_header_1_0(file)
+        elif version == (2,0):
+            shape,fortran,dtype = np.lib.format.read_array_header_2_0(file)
+        else:
+            return readArray(archive,name)
+        offset = file.tell()
+    if dtype.hasobject or int(np.prod(shape)) == 0: # empty arrays cannot be mapped
+        return readArray(archive,name)
+    return np.memmap(archive.filename,dtype=dtype,mode='c',shape=shape,order='F' if fortran else 'C',offset=offset)
+
+def unmapSolution(solution): # reads the mapped sections of a loaded solution into memory
+    owners = [vars(solution)] + list(getattr(solution,'loadCaseResults',dict()).values())
+    if getattr(solution,'results',None) is not None:
+        owners.append(vars(solution.results))
+    for values in owners:
+        for key,value in list(values.items()):
+            if isinstance(value,np.memmap):
+                values[key] = np.array(value)
+    return
+
+def replaceFile(source,target):
+    if hasattr(os,'replace'):
+        os.replace(source,target)
+    else: # python 2 cannot rename over an existing file on windows
+        if os.name == 'nt' and os.path.exists(target):
+            os.remove(target)
+        os.rename(source,target)
+    return
+
+def getModelSections(Model): # header entries and typed arrays of the model definition
+    d = Model.dimensions
+    arrays = dict()
+
+    materials = list(Model._Materials.values())
+    arrays['materials/numbers'] = np.array([m.number for m in materials],dtype=int)
+    arrays['materials/properties'] = np.array([[m.modulus,m.area,m.density] for m in materials],dtype=float).reshape([-1,3])
+
+    # free directions are stored as NaN constraints, as in the node store
+    numbers = list(Model._Nodes)
+    arrays['nodes/numbers'] = np.array(numbers,dtype=int)
+    coordinates,constraints,forces = FEALinkNode.getNodeArrays(Model._Nodes,numbers,d)
+    arrays['nodes/coordinates'] = coordinates
+    arrays['nodes/constraints'] = constraints
+    arrays['nodes/forces'] = forces
+
+    links = list(Model._Links.values())
+    arrays['links/numbers'] = np.array([link.number for link in links],dtype=int)
+    arrays['links/nodes'] = np.array([[link.node1.number,link.node2.number] for link in links],dtype=int).reshape([-1,2])
+    arrays['links/materials'] = np.array([link.material.number for link in links],dtype=int)
+
+    # load case names can hold any character, so their sections are numbered in the order of the header list
+    caseNames = sorted(Model._LoadCases)
+    for k,name in enumerate(caseNames):
+        case = Model._LoadCases[name]
+        arrays['loadcases/%d/nodes' % k] = np.array(list(case),dtype=int)
+        arrays['loadcases/%d/forces' % k] = np.array(list(case.values()),dtype=float).reshape([-1,d])
+
+    header = dict()
+    header['name'] = Model.name
+    header['dimensions'] = d
+    header['units'] = Model.units
+    header['notes'] = Model.notes
+    header['scope'] = dict((key,value) for key,value in vars(Model._Scope).items())
+    header['loadCases'] = caseNames
+    return header,arrays
+
+def getSolutionSections(solution): # header entries and result arrays of a solution, without any matrices
+    state = solution.__getstate__()
+    attributes = dict()
+    arrays = dict()
+    for key,value in state.items():
+        if key in _rebuiltAttributes:
+            continue
+        if isinstance(value,np.ndarray):
+            if np.ndim(value) == 2 and np.shape(value)[0] == np.shape(value)[1] == solution.size and solution.size > 1:
+                continue # dense matrices are rebuilt by the next solve
+            arrays['solution/' + key] = value
+            continue
+        try:
+            json.dumps(value,default=getPlain)
+        except (TypeError,ValueError):
+            continue # operators and other objects the next solve recreates
+        attributes[key] = value
+
+    results = solution.results
+    if results is not None:
+        arrays['results/nodeNumbers'] = results.nodeNumbers
+        arrays['results/linkNumbers'] = results.linkNumbers
+        arrays['results/linkEnds'] = np.asarray(results.linkEnds,dtype=int).reshape([-1,2])
+        arrays['results/materials'] = np.array([m.number for m in results.materials],dtype=int)
+        for column in _resultColumns:
+            arrays['results/' + column] = getattr(results,column)
+    for k,name in enumerate(getattr(solution,'caseNames',[])): # solutions of older versions have no load cases
+        for key,values in solution.loadCaseResults.get(name,dict()).items():
+            arrays['loadcaseresults/%d/%s' % (k,key)] = values
+
+    header = dict()
+    header['attributes'] = attributes
+    header['hasResults'] = results is not None
+    header['mass'] = [[num,solution._Length[num],solution._Mass[num]] for num in solution._Length]
+    return header,arrays
+
+def writeModelFile(filename,Model,saveSolution=True):
+    header,arrays = getModelSections(Model)
+    header['format'] = formatName
+    header['version'] = formatVersion
+    header['solution'] = None
+    results = dict()
+    if saveSolution and Model._Solution is not None:
+        header['solution'],results = getSolutionSections(Model._Solution)
+
+    # the model may map its results from the file being replaced, so they are read in and the new file is
+    # written next to it, a failed save also leaves the old file as it was
+    if Model._Solution is not None:
+        unmapSolution(Model._Solution)
+    temporary = str(filename) + '.saving'
+    try:
+        with zipfile.ZipFile(temporary,'w',zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('header.json',json.dumps(header,default=getPlain,indent=1).encode('utf-8'))
+            for name in sorted(arrays):
+                writeArray(archive,name,arrays[name])
+            for name in sorted(results): # uncompressed, so the columns can be mapped in place
+                writeArray(archive,name,results[name],compress=False)
+        replaceFile(temporary,str(filename))
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return
+
+def readHeader(archive):
+    header = json.loads(archive.read('header.json').decode('utf-8'))
+    if header.get('format') != formatName:
+        raise ValueError("Not a FEALink model file")
+    if header.get('version',0) > formatVersion:
+        raise ValueError("Model file version %s is newer than this FEALink (version %d)" % (header.get('version'),formatVersion))
+    return header
+
+def readModelFile(filename,mapResults=True): # model info in the order of the pickled format: name, dimensions,
+                                             # materials, nodes, links, scope, solution, units, notes, load cases
+    # with mapResults the solution is mapped from the file, so opening a model costs about as much as its geometry
+    with zipfile.ZipFile(str(filename),'r') as archive:
+        header = readHeader(archive)
+        d = header['dimensions']
+
+        materials = dict()
+        for num,(E,A,D) in zip(readArray(archive,'materials/numbers').tolist(),readArray(archive,'materials/properties').tolist()):
+            materials[num] = FEALinkMaterial.Material(num,E,A,D)
+
+        # the node arrays go into the store as they are, the nodes and links are views of its rows
+        store = FEALinkNode.NodeStore(d)
+        numbers = readArray(archive,'nodes/numbers').tolist()
+        linkNumbers = readArray(archive,'links/numbers').tolist()
+        collecting = gc.isenabled()
+        gc.disable() # only new objects are made, cyclic collection passes over them would double the time
+        try:
+            nodes = dict(zip(numbers,store.addNodes(numbers,readArray(archive,'nodes/coordinates'))))
+            store.constraints[:len(numbers)] = readArray(archive,'nodes/constraints')
+            store.forces[:len(numbers)] = readArray(archive,'nodes/forces')
+            nodes1 = list()
+            nodes2 = list()
+            for num,(n1,n2) in zip(linkNumbers,readArray(archive,'links/nodes').tolist()):
+                node1 = nodes[n1]
+                node2 = nodes[n2]
+                node1.linkedNodes[n2] = num
+                node2.linkedNodes[n1] = num
+                nodes1.append(node1)
+                nodes2.append(node2)
+            linkMaterials = [materials[mat] for mat in readArray(archive,'links/materials').tolist()]
+            links = dict(zip(linkNumbers,FEALinkLink.getLinkStore(store).addLinks(linkNumbers,nodes1,nodes2,linkMaterials)))
+        finally:
+            if collecting:
+                gc.enable()
+
+        loadCases = dict()
+        for k,name in enumerate(header['loadCases']):
+            caseNodes = readArray(archive,'loadcases/%d/nodes' % k).tolist()
+            caseForces = readArray(archive,'loadcases/%d/forces' % k).tolist()
+            loadCases[name] = dict(zip(caseNodes,caseForces))
+
+        scope = FEALinkScope.Scope.__new__(FEALinkScope.Scope)
+        scope.__dict__.update(header['scope'])
+
+        solution = None
+        if header['solution'] is not None:
+            solution = readSolution(archive,header['solution'],materials,nodes,links,loadCases,mapResults)
+
+    return [header['name'],d,materials,nodes,links,scope,solution,header['units'],header['notes'],loadCases]
+
+def readSolution(archive,header,materials,nodes,links,loadCases,mapResults=True):
+    readSection = mapArray if mapResults else readArray
+    solution = FEALinkSolution.Solution.__new__(FEALinkSolution.Solution)
+    solution.__dict__.update(header['attributes'])
+    solution._Nodes = nodes
+    solution._Links = links
+    solution._LoadCases = loadCases
+    solution.connectivity = None
+    solution.graph = None
+    solution.factor = None
+    names = [name[:-len('.npy')] for name in archive.namelist() if name.endswith('.npy')]
+    for name in names:
+        if name.startswith('solution/'):
+            setattr(solution,name[len('solution/'):],readSection(archive,name))
+    if hasattr(solution,'nodeNumbers'): # converted solutions of older versions have only their results
+        solution.nodeIndex = dict((num,i) for i,num in enumerate(solution.nodeNumbers.tolist()))
+    solution.caseNames = header['attributes'].get('caseNames',[])
+    solution._Length = dict((num,length) for num,length,mass in header['mass'])
+    solution._Mass = dict((num,mass) for num,length,mass in header['mass'])
+
+    solution.loadCaseResults = dict()
+    for k,name in enumerate(solution.caseNames):
+        prefix = 'loadcaseresults/%d/' % k
+        solution.loadCaseResults[name] = dict((key[len(prefix):],readSection(archive,key)) for key in names if key.startswith(prefix))
+
+    solution.results = None
+    solution._SolNodes = dict()
+    solution._SolLinks = dict()
+    if header['hasResults']:
+        coordinates = readArray(archive,'results/coordinates')
+        linkMaterials = [materials.get(num) for num in readArray(archive,'results/materials').tolist()]
+        results = FEALinkSolution.SolutionResults(solution.dimensions,readArray(archive,'results/nodeNumbers'),coordinates,
+                                        readArray(archive,'results/linkNumbers'),readArray(archive,'results/linkEnds'),linkMaterials)
+        for column in _resultColumns:
+            setattr(results,column,readSection(archive,'results/' + column))
+        solution.results = results
+        nodeOrder = [num for num in nodes if num in results.nodeRow] # same order compileSolution() uses
+        solution._SolNodes = FEALinkSolution.ResultMapping(results,nodeOrder,results.nodeRow,FEALinkSolution.NodeSolution)
+        solution._SolLinks = FEALinkSolution.ResultMapping(results,results.linkNumbers.tolist(),results.linkRow,FEALinkSolution.LinkSolution)
+    return solution
+
+def convertModelFile(filename,output=None): # rewrites a pickled model in the current format, returns the new file
+    import FEALinkModel # imported here, as the model module imports this one
+    if isModelFile(filename):
+        raise ValueError("Already in the current format")
+    model = FEALinkModel.Model(load=True,filename=filename,gui=False)
+    if output is None: # in place, keeping the pickle
+        output = filename
+        shutil.copy2(filename,filename + '.pickle')
+    model.name = output
+    writeModelFile(output,model)
+    return output
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Convert pickled FEALink models to the current file format.")
+    parser.add_argument('models',nargs='+',help="model files saved by an older FEALink")
+    parser.add_argument('-o','--output',default=None,help="folder for the converted models, in place by default")
+    arguments = parser.parse_args(arguments)
+
+    failed = False
+    for filename in arguments.models:
+        output = None
+        if arguments.output is not None:
+            if not os.path.isdir(arguments.output):
+                os.makedirs(arguments.output)
+            output = os.path.join(arguments.output,os.path.basename(filename))
+        try:
+            print('%s -> %s' % (filename,convertModelFile(filename,output)))
+        except Exception as error:
+            print('%s: %s' % (filename,error))
+            failed = True
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# FEALinkImportTime
+#
+# This module times the imports of the FEALink entry points, each in a fresh interpreter
+#
+# usage: python FEALinkImportTime.py [-r REPEAT]
+#
+# The start center, the headless solve path and the model data classes must not load the plotting
+# libraries, which only load once a model window opens, and nothing but the start center may load Tk.
+# The script exits with 1 if one of them does, so it can guard startup time next to the regression runs.
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# entry point -> modules it must not import
+_entryPoints = [
+    ('FEALink',['matplotlib','mpl_toolkits.mplot3d']), # start center
+    ('FEALinkModel',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']), # Tk loads with the first window
+    ('FEALinkNode',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']),
+    ('FEALinkLink',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']),
+    ('FEALinkSolution',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']), # headless solve
+    ('FEALinkBatch',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']),
+    ('FEALinkFile',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']), # model file reading and writing
+    ('FEALinkScript',['matplotlib','mpl_toolkits.mplot3d','Tkinter','tkinter']), # headless command scripts
+]
+
+# imports module and prints the time it took and the modules it loaded
+_timer = '''
+import sys,time,json
+start = time.time()
+__import__(sys.argv[1])
+elapsed = time.time() - start
+print(json.dumps({'time':elapsed,'modules':sorted(sys.modules)}))
+'''
+
+def timeImport(module,folder): # seconds to import the module in a new interpreter, and the modules it loaded
+    process = subprocess.Popen([sys.executable,'-c',_timer,module],cwd=folder,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    output,errors = process.communicate()
+    if process.returncode != 0:
+        raise ImportError(errors.decode('utf-8','replace').strip().splitlines()[-1])
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return result['time'],set(result['modules'])
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Time the imports of the FEALink entry points.")
+    parser.add_argument('-r','--repeat',type=int,default=3,help="fresh interpreters per entry point, the fastest counts")
+    arguments = parser.parse_args(arguments)
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    failed = False
+    for module,forbidden in _entryPoints:
+        try:
+            times = list()
+            for k in range(arguments.repeat):
+                elapsed,modules = timeImport(module,folder)
+                times.append(elapsed)
+        except ImportError as error:
+            print('%-16s import failed: %s' % (module,error))
+            failed = True
+            continue
+        loaded = [name for name in forbidden if name in modules]
+        if loaded:
+            failed = True
+            print('%-16s %7.3f s  loads %s' % (module,min(times),', '.join(loaded)))
+        else:
+            print('%-16s %7.3f s' % (module,min(times)))
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
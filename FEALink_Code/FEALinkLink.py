@@ -4,13 +4,129 @@
 #
 # This module implements the Link class
 
-import matplotlib
 import numpy as np
-from mpl_toolkits.mplot3d import Axes3D
 import FEALinkNode
 import FEALinkMaterial
 
+class LinkStore(object):
+    # columnar link data, each Link is a view of one row, rows of deleted links are reused
+    def addRows(self,count): # first of count new rows at the end
+        start = self.size
+        if start+count > len(self.ends):
+            capacity = max(16,2*(start+count))
+            ends = np.zeros([capacity,2],dtype=int)
+            ends[:start] = self.ends[:start]
+            self.ends = ends
+        self.size += count
+        self.changed += 1
+        return start
+
+    def addRow(self,ends):
+        if self.freeRows:
+            row = self.freeRows.pop()
+        else:
+            row = self.addRows(1)
+        self.ends[row] = ends
+        self.changed += 1
+        return row
+
+    def releaseRow(self,row):
+        self.freeRows.append(row)
+        return
+
+    def addLinks(self,numbers,nodes1,nodes2,materials): # views for a block of new links
+        start = self.addRows(len(numbers))
+        stop = start+len(numbers)
+        self.ends[start:stop,0] = [node.row for node in nodes1]
+        self.ends[start:stop,1] = [node.row for node in nodes2]
+        links = list()
+        for row,num,node1,node2,material in zip(range(start,stop),numbers,nodes1,nodes2,materials):
+            link = Link.__new__(Link)
+            link.number = num
+            link.node1 = node1
+            link.node2 = node2
+            link.material = material
+            link.store = self
+            link.row = row
+            links.append(link)
+        return links
+
+    def getGeometry(self,rows=None): # lengths, unit vectors and label midpoints of all rows, or of the given rows
+        # the arrays of all rows are kept until a node moves or a link is added, then made again in one pass
+        current = (self.nodes.moved,self.changed)
+        if self.geometryState != current:
+            if rows is not None and 8*len(rows) < self.size: # a few rows are made alone, the rest waits for a full request
+                return getLinkGeometry(self.nodes.coordinates,self.ends[rows])
+            self.geometry = getLinkGeometry(self.nodes.coordinates,self.ends[:self.size])
+            self.geometryState = current
+        if rows is None:
+            return self.geometry
+        return tuple(values[rows] for values in self.geometry)
+
+    def __init__(self,nodes):
+        self.nodes = nodes # FEALinkNode.NodeStore the ends refer to
+        self.ends = np.zeros([0,2],dtype=int) # NodeStore rows of both link ends
+        self.size = 0 # rows handed out so far
+        self.freeRows = list() # rows of deleted links
+        self.changed = 0 # counts row changes, with NodeStore.moved it tells when the geometry is out of date
+        self.geometry = None # (lengths,unit vectors,label midpoints) of rows 0 to size
+        self.geometryState = None
+        return
+
+def getLinkGeometry(coordinates,ends): # lengths, unit vectors from node1 to node2 and label midpoints, in one pass
+    start = coordinates[ends[:,0]]
+    end = coordinates[ends[:,1]]
+    delta = end - start
+    lengths = np.sqrt(np.sum(delta**2,axis=1))
+    with np.errstate(divide='ignore',invalid='ignore'): # rows of deleted links may join a node to itself
+        cosines = delta/lengths[:,np.newaxis] # (cos,sin) in 2D, (cosx,cosy,cosz) in 3D
+    midpoints = .55*start + .45*end
+    return lengths,cosines,midpoints
+
+def gatherLinkGeometry(links,dimensions): # end coordinates (links,2,d), lengths, unit vectors and label midpoints of a list of links
+    if len(links) == 0:
+        return np.zeros([0,2,dimensions]),np.zeros(0),np.zeros([0,dimensions]),np.zeros([0,dimensions])
+    store = links[0].store
+    if store is not None and all(link.store is store for link in links):
+        rows = np.array([link.row for link in links],dtype=int)
+        lengths,cosines,midpoints = store.getGeometry(rows)
+        return store.nodes.coordinates[store.ends[rows]],lengths,cosines,midpoints
+    # links of several stores, their ends are gathered one by one
+    points = np.array([[link.node1.getPosition(),link.node2.getPosition()] for link in links],dtype=float)
+    lengths,cosines,midpoints = getLinkGeometry(points.reshape([2*len(links),-1]),np.arange(2*len(links)).reshape([-1,2]))
+    return points,lengths,cosines,midpoints
+
+def plotLinks(display,links,showNumbers=True): # draws the links as one line broken between links, looks like Link.plotLink
+    if len(links) == 0:
+        return
+    points,lengths,cosines,midpoints = gatherLinkGeometry(links,links[0].dimensions)
+    breaks = np.full([len(links),1,points.shape[2]],np.nan)
+    lines = np.concatenate([points,breaks],axis=1).reshape([-1,points.shape[2]]).T
+    display.plot(*lines,color='b')
+    if showNumbers == True:
+        for link,midpoint in zip(links,midpoints.tolist()):
+            if len(midpoint) == 2:
+                display.text(midpoint[0],midpoint[1],'%s' % str(link.number),size=11,color='b')
+            else:
+                display.text(midpoint[0],midpoint[1],midpoint[2],'%s' % str(link.number),size=11,zorder=1,color='b')
+    return
+
+def getLinkStore(nodeStore): # store of the links between the nodes of a FEALinkNode.NodeStore
+    if nodeStore.links is None:
+        nodeStore.links = LinkStore(nodeStore)
+    return nodeStore.links
+
+def gatherLinks(links,nodeStore): # puts links of older versions, or of nodes moved to a new store, into its link store
+    store = getLinkStore(nodeStore)
+    for link in links.values():
+        if link.store is not store:
+            link.store = store
+            link.row = store.addRow([link.node1.row,link.node2.row])
+    return store
+
 class Link(object):
+    __slots__ = ('number','node1','node2','material','store','row')
+
     def plotLink(self,display,showNumbers=True):
         if self.dimensions == 2:
             display.plot(self.x,self.y,'b')
@@ -22,34 +138,68 @@ class Link(object):
                 display.text(self.xmid,self.ymid,self.zmid,'%s' % str(self.number),size=11,zorder=1,color='b')
         return
 
-    def getAngles(self):
-        if self.dimensions == 2:
-            self.cos = (self.x[1]-self.x[0])/self.length
-            self.sin = (self.y[1]-self.y[0])/self.length
-        else:
-            self.cosx = (self.x[1]-self.x[0])/self.length
-            self.cosy = (self.y[1]-self.y[0])/self.length
-            self.cosz = (self.z[1]-self.z[0])/self.length
+    def release(self): # hands the row back to the store once the link is deleted from its model
+        if self.store is not None:
+            self.store.releaseRow(self.row)
         return
 
+    def getGeometry(self,k,column=None): # entry of the store's geometry arrays for this link
+        if self.store is None: # not yet in a model's store
+            geometry = getLinkGeometry(np.array([self.node1.getPosition(),self.node2.getPosition()],dtype=float),np.array([[0,1]]))
+            row = 0
+        else:
+            geometry = self.store.getGeometry()
+            row = self.row
+        if column is None:
+            return geometry[k].item(row)
+        if column >= self.dimensions:
+            raise AttributeError("2D link has no z values")
+        return geometry[k].item(row,column)
+
+    # the geometry follows the nodes, so moving a node needs no new link
+    dimensions = property(lambda self: self.node1.dimensions)
+    x = property(lambda self: [self.node1.x,self.node2.x])
+    y = property(lambda self: [self.node1.y,self.node2.y])
+    z = property(lambda self: [self.node1.z,self.node2.z])
+    length = property(lambda self: self.getGeometry(0))
+    cos = property(lambda self: self.getGeometry(1,0))
+    sin = property(lambda self: self.getGeometry(1,1))
+    cosx = property(lambda self: self.getGeometry(1,0))
+    cosy = property(lambda self: self.getGeometry(1,1))
+    cosz = property(lambda self: self.getGeometry(1,2))
+    xmid = property(lambda self: self.getGeometry(2,0))
+    ymid = property(lambda self: self.getGeometry(2,1))
+    zmid = property(lambda self: self.getGeometry(2,2))
+
     def __str__(self):
         output = "Link __str__ function not yet implemented"
         return output
 
+    def __getstate__(self):
+        return (self.number,self.node1,self.node2,self.material,self.store,self.row)
+
+    def __setstate__(self,state):
+        if isinstance(state,dict): # pickled by older versions with its geometry, the model moves it into a store
+            self.number = state['number']
+            self.node1 = state['node1']
+            self.node2 = state['node2']
+            self.material = state['material']
+            self.store = None
+            self.row = None
+        else:
+            self.number,self.node1,self.node2,self.material,self.store,self.row = state
+        return
+
     def __init__(self,num,node1,node2,material):
         self.number = num
         self.node1 = node1 # FEALinkNode.Node object
         self.node2 = node2
         self.material = material # FEALinkMaterial.Material object
-        self.dimensions = node1.dimensions
-        self.x = [node1.x,node2.x]
-        self.y = [node1.y,node2.y]
-        self.xmid = (.55*node1.x+.45*node2.x)
-        self.ymid = (.55*node1.y+.45*node2.y)
-        if self.dimensions == 2:
-            self.length = np.sqrt((self.x[0]-self.x[1])**2 + (self.y[0]-self.y[1])**2)
-        else:
-            self.z = [node1.z,node2.z]
-            self.zmid = (.55*node1.z+.45*node2.z)
-            self.length = np.sqrt((self.x[0]-self.x[1])**2 + (self.y[0]-self.y[1])**2 + (self.z[0]-self.z[1])**2)
-        self.getAngles()
+        if node2.store is not node1.store: # a node made on its own joins the store of the node it is linked to
+            small,large = sorted([node1,node2],key=lambda node: node.store.size)
+            if small.store.links is not None:
+                raise ValueError("Nodes of different models cannot be linked")
+            small.moveToStore(large.store)
+        self.store = getLinkStore(node1.store)
+        self.row = self.store.addRow([node1.row,node2.row])
+        return
@@ -5,6 +5,8 @@
 # This module implements the Material class
 
 class Material(object):
+    __slots__ = ('number','modulus','area','density')
+
     def __str__(self):
         output = "Material __str__ function not yet implemented"
         return output
@@ -26,6 +28,16 @@ class Material(object):
 
         return output
 
+    def __getstate__(self):
+        return (self.number,self.modulus,self.area,self.density)
+
+    def __setstate__(self,state):
+        if isinstance(state,dict): # pickled by older versions, some without density
+            self.__init__(state['number'],state['modulus'],state['area'],state.get('density',0))
+        else:
+            self.number,self.modulus,self.area,self.density = state
+        return
+
     def __init__(self,num,E,A,density=0):
         self.number = num
         self.modulus = E
@@ -2,38 +2,54 @@
 # Ryan Arata
 # updated May 2016
 #
-# This module implements the Model class, including the GUI interface
+# This module implements the Model class, including the GUI interface, whose Tk libraries load with the first window
 
-try:
-    from Tkinter import *
-except:
-    from tkinter import *
+import gc
 import numpy as np
-import matplotlib
 try:
     import cPickle as pickle
 except:
     import pickle
-try:
-    import FileDialog
-    import tkFileDialog as tkfd
-except:
-    import tkinter.filedialog as tkfd
-matplotlib.use('TkAgg')
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
-from matplotlib.backend_bases import key_press_handler
-from matplotlib.figure import Figure
-import matplotlib.lines as mlines 
-from mpl_toolkits.mplot3d import Axes3D
-try:
-    import ttk
-except:
-    import tkinter.ttk as ttk
 import FEALinkMaterial
 import FEALinkNode
 import FEALinkLink
 import FEALinkScope
 import FEALinkSolution
+import FEALinkFile
+import FEALinkScript
+
+def loadInterface(): # Tk and its dialogs are imported when the first model window opens, headless models never load them
+    global tkfd,ttk
+    try:
+        import Tkinter as tk
+    except:
+        import tkinter as tk
+    # same names as 'from tkinter import *', which is only allowed at module level
+    names = getattr(tk,'__all__',[name for name in dir(tk) if not name.startswith('_')])
+    module = globals()
+    for name in names:
+        if name not in module:
+            module[name] = getattr(tk,name)
+    try:
+        import FileDialog
+        import tkFileDialog as tkfd
+    except:
+        import tkinter.filedialog as tkfd
+    try:
+        import ttk
+    except:
+        import tkinter.ttk as ttk
+    return
+
+def loadPlotting(): # matplotlib and its Tk backend are imported when the first model window opens, not at startup
+    global matplotlib,FigureCanvasTkAgg,NavigationToolbar2TkAgg,key_press_handler,Figure,mlines
+    import matplotlib
+    matplotlib.use('TkAgg')
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
+    from matplotlib.backend_bases import key_press_handler
+    from matplotlib.figure import Figure
+    import matplotlib.lines as mlines
+    return
 
 class Model(object):
 ################## Interface Behavior Methods ##################
@@ -42,6 +58,11 @@ class Model(object):
         print('you pressed %s' % event.key)
         key_press_handler(event, self.canvas, self.toolbar)
         return
+
+    def on_tab_changed(self,event):
+        if self._Solution is not None and not self.solutionListed and self.notebook.select() == str(self.solutionPage):
+            self.updateSolutionNotebook()
+        return
         
 #---Interface updates---
     def wipeErrorLabels(self):
@@ -102,9 +123,8 @@ class Model(object):
                 node.plotNode(self.display,self._Scope,showNumbers=self.nodeNumbers.get(),showConstraints=self.showConstraints.get(),
                                 showForces=self.showForces.get(),maxForce=self.getMaxForce())
 
-            # plot links
-            for num,link in self._Links.items():
-                link.plotLink(self.display,showNumbers=self.linkNumbers.get())
+            # plot links, all in one line from the cached link geometry
+            FEALinkLink.plotLinks(self.display,list(self._Links.values()),showNumbers=self.linkNumbers.get())
 
         # 3d plot
         else:
@@ -114,8 +134,7 @@ class Model(object):
                                 showForces=self.showForces.get(),maxForce=self.getMaxForce())
 
             # plot links
-            for num,link in self._Links.items():
-                link.plotLink(self.display,self.linkNumbers.get())
+            FEALinkLink.plotLinks(self.display,list(self._Links.values()),showNumbers=self.linkNumbers.get())
         return
 
     def plotExaggeration(self):
@@ -184,7 +203,10 @@ class Model(object):
         self.updateConstraintList()
         self.updateForceList()
         if self._Solution != None:
-            self.updateSolutionNotebook()
+            # result tables of large models take long to fill, so they wait until the solution page is shown
+            self.solutionListed = False
+            if self.notebook.select() == str(self.solutionPage):
+                self.updateSolutionNotebook()
         return
 
 #---Command Line---
@@ -242,12 +264,22 @@ class Model(object):
             self.commandAddForce(command)
         elif commandType in ['df','deleteforce']:
             self.commandDeleteForce(command)
+        elif commandType in ['lc','loadcase','addloadcase']:
+            self.commandAddLoadCase(command)
+        elif commandType in ['dlc','deleteloadcase']:
+            self.commandDeleteLoadCase(command)
+        elif commandType in ['ulc','useloadcase']:
+            self.commandUseLoadCase(command)
         elif commandType in ['mn','multinode','linnode','linearnode']:
             self.commandLinNode(command)
         elif commandType in ['ml','multilink']:
             self.commandMultiLink(command)
         elif commandType in ['s','solve']:
             self.commandSolve()
+        elif commandType in ['calibrate','calibratesolvers']:
+            self.commandCalibrate()
+        elif commandType in ['script','runscript','run']:
+            self.commandRunScript(command)
         elif commandType in ['nn','nodenumbers']:
             self.nodeNumCheck.toggle()
             self.updatePlot()
@@ -527,6 +559,44 @@ class Model(object):
             self.forceErrorLabel.config(fg="red",text = "Errors deleting forces on nodes: " + str(errorList))
         return
 
+    def commandAddLoadCase(self,command):
+        self.notebook.select(self.forcePage)
+        if len(command) != 1 or command[0] == "":
+            self.forceErrorLabel.config(text="Error: Load case requires a single name")
+            self.forcePage.after(2500,self.wipeErrorLabels)
+            return
+        if self.addLoadCase(command[0]):
+            self.forceErrorLabel.config(fg="orange",text="Warning: Replacing load case " + command[0])
+        else:
+            self.forceErrorLabel.config(fg="green",text="Saved load case " + command[0])
+        self.forcePage.after(2500,self.wipeErrorLabels)
+        return
+
+    def commandDeleteLoadCase(self,command):
+        self.notebook.select(self.forcePage)
+        errorList = list()
+        for name in command:
+            if not self.deleteLoadCase(name):
+                errorList.append(name)
+        if len(errorList) > 0:
+            self.forceErrorLabel.config(fg="red",text = "Errors deleting load cases: " + str(errorList))
+            self.forcePage.after(2500,self.wipeErrorLabels)
+        return
+
+    def commandUseLoadCase(self,command):
+        self.notebook.select(self.forcePage)
+        if len(command) != 1 or command[0] == "":
+            self.forceErrorLabel.config(text="Error: Load case requires a single name")
+            self.forcePage.after(2500,self.wipeErrorLabels)
+            return
+        if not self.useLoadCase(command[0]):
+            self.forceErrorLabel.config(text="Error: Load case does not exist")
+            self.forcePage.after(2500,self.wipeErrorLabels)
+            return
+        self.updateForceList()
+        self.updatePlot()
+        return
+
     def commandLinNode(self,command):
         self.notebook.select(self.nodePage)
         if len(command) > 3+2*self.dimensions:
@@ -579,10 +649,45 @@ class Model(object):
         self.multiLink()
         return
 
+    def commandRunScript(self,command):
+        if len(command) == 0 or command[0] == "":
+            filename = tkfd.askopenfilename()
+            if not filename:
+                return
+        else:
+            filename = command[0]
+        try:
+            errors,messages = self.runScript(filename)
+        except (IOError,OSError) as error:
+            errors,messages = [str(error)],[]
+        if errors: # the model is unchanged, the first error and the number of others are shown
+            text = "script not run, " + errors[0]
+            if len(errors) > 1:
+                text += " (%d more errors)" % (len(errors)-1)
+        else:
+            text = "script " + str(filename) + " done"
+            if messages:
+                text += ": " + messages[-1]
+        self.commandLine.insert(0,text)
+        self.commandLine.select_range(0,END)
+        return
+
     def commandSolve(self):
         self.notebook.select(self.solutionPage)
         self.solve()
 
+    def commandCalibrate(self):
+        # time the solver backends on this machine and store the dispatch thresholds
+        self.notebook.select(self.solutionPage)
+        self.solErrorLabel.config(fg = "black",text="Calibrating solvers...")
+        self.solutionPage.update_idletasks()
+        thresholds = FEALinkSolution.calibrateSolvers()
+        if 'directTime' in thresholds:
+            self.solErrorLabel.config(fg = "black",text="Solver calibration saved: dense up to %d dofs, direct or cg by predicted time" % thresholds['denseMaxDofs'])
+        else:
+            self.solErrorLabel.config(fg = "black",text="Solver calibration saved: dense up to %d dofs, too few timings to compare direct and cg" % thresholds['denseMaxDofs'])
+        self.solutionPage.after(2500,self.wipeErrorLabels)
+
 #---Material---
     def newMaterial(self,event=None):
         # Check that number is an integer
@@ -624,7 +729,8 @@ class Model(object):
             self._Materials[num] = FEALinkMaterial.Material(num,E,A,D)
             for linkNum,link in self._Links.items():
                 if link.material.number == num:
-                    self._Links[linkNum] = FEALinkLink.Link(linkNum,link.node1,link.node2,self._Materials[num])
+                    link.material = self._Materials[num]
+                    self.markEdited([linkNum])
         else:
             self._Materials[num] = FEALinkMaterial.Material(num,E,A,D)
         self.updateMaterialList()
@@ -688,17 +794,13 @@ class Model(object):
         
         # check if there is already a node in that location
         if self.dimensions == 2:
-            for n,node in self._Nodes.items():
-                if node.x == X and node.y == Y:
-                    self.nodeErrorLabel.config(text="Error: Node exists in that location")
-                    self.nodePage.after(2500,self.wipeErrorLabels)
-                    return
+            position = (X,Y)
         else:
-            for n,node in self._Nodes.items():
-                if node.z == Z and node.y == Y and node.x == X:
-                    self.nodeErrorLabel.config(text="Error: Node exists in that location")
-                    self.nodePage.after(2500,self.wipeErrorLabels)
-                    return
+            position = (X,Y,Z)
+        if self.getNodeGrid().find(position,ignore=num) is not None:
+            self.nodeErrorLabel.config(text="Error: Node exists in that location")
+            self.nodePage.after(2500,self.wipeErrorLabels)
+            return
 
         # check if node exists and replace
         if num in self._Nodes:
@@ -708,16 +810,12 @@ class Model(object):
             self._Nodes[num].y = Y
             if self.dimensions == 3:
                 self._Nodes[num].z = Z
-            thisNode = self._Nodes[num]
-            for linkNum,link in self._Links.items():
-                if link.node1.number == num:
-                    otherNode = link.node2
-                    self._Links[linkNum] = FEALinkLink.Link(linkNum,thisNode,otherNode,link.material)
-                elif link.node2.number == num:
-                    otherNode = link.node1
-                    self._Links[linkNum] = FEALinkLink.Link(linkNum,otherNode,thisNode,link.material)
+            self.markEdited(self._Nodes[num].getLinks()) # the links at the node changed length and angle
         else:
-            self._Nodes[num] = FEALinkNode.Node(num,X,Y,Z)
+            self._Nodes[num] = FEALinkNode.Node(num,X,Y,Z,store=self._NodeStore)
+            self.markEdited(structure=True)
+        self._NodeGrid.remove(num)
+        self._NodeGrid.add(num,position)
         self.updateNodeList()
 
         # update scope to include the new node
@@ -744,7 +842,9 @@ class Model(object):
                 self.nodePage.after(2500,self.wipeErrorLabels)
                 return
             else:
-                del self._Nodes[num]
+                self._Nodes.pop(num).release()
+                self.getNodeGrid().remove(num)
+                self.markEdited(structure=True)
                 self.updateNodeList()
         else:
             self.nodeErrorLabel.config(fg="blue",text="Note: Node number does not exist to delete")
@@ -820,39 +920,45 @@ class Model(object):
         if self.dimensions == 3:
             z = np.linspace(zStart,zEnd,numNodes)
 
-        # check for nodes in positions
+        # check for nodes in positions, including the new nodes overlapping each other
         if self.dimensions == 2:
-            for i in range(0,numNodes):
-                for n,node in self._Nodes.items():
-                    if node.x == x[i] and node.y == y[i]:
-                        self.nodeErrorLabel.config(text="MultiNode Error: Node overlaps existing node location")
-                        self.nodePage.after(2500,self.wipeErrorLabels)
-                        return
+            positions = list(zip(x.tolist(),y.tolist()))
         else:
-            for i in range(0,numNodes):
-                for n,node in self._Nodes.items():
-                    if node.z == z[i] and node.y == y[i] and node.x == x[i]:
-                        self.nodeErrorLabel.config(text="MultiNode Error: Node overlaps existing node location")
-                        self.nodePage.after(2500,self.wipeErrorLabels)
-                        return
+            positions = list(zip(x.tolist(),y.tolist(),z.tolist()))
+        grid = self.getNodeGrid()
+        newGrid = FEALinkNode.NodeGrid(dimensions=self.dimensions,tolerance=grid.tolerance)
+        for num,position in zip(nodeNums,positions):
+            if grid.find(position) is not None or newGrid.find(position) is not None:
+                self.nodeErrorLabel.config(text="MultiNode Error: Node overlaps existing node location")
+                self.nodePage.after(2500,self.wipeErrorLabels)
+                return
+            newGrid.add(num,position)
 
         # create the nodes
         if self.dimensions == 2:
             for i in range(0,numNodes):
                 num = nodeNums[i]
-                self._Nodes[num] = (FEALinkNode.Node(num,x[i],y[i]))
+                self._Nodes[num] = (FEALinkNode.Node(num,x[i],y[i],store=self._NodeStore))
                 self._Scope.expandScope(self._Nodes[num])
         else:
             for i in range(0,numNodes):
                 num = nodeNums[i]
-                self._Nodes[num] = (FEALinkNode.Node(num,x[i],y[i],z[i]))
+                self._Nodes[num] = (FEALinkNode.Node(num,x[i],y[i],z[i],store=self._NodeStore))
                 self._Scope.expandScope(self._Nodes[num])
+        for num,position in zip(nodeNums,positions):
+            grid.add(num,position)
+        self.markEdited(structure=True)
 
         self.updateNodeList()
         self.updatePlot()
 
         return
 
+    def getNodeGrid(self): # spatial index of the node positions for finding coincident nodes
+        if self._NodeGrid is None:
+            self._NodeGrid = FEALinkNode.NodeGrid(self._Nodes,self.dimensions)
+        return self._NodeGrid
+
     def updateNodeList(self):
         self.nodeListTree.delete(*self.nodeListTree.get_children())
         if self.dimensions == 3:
@@ -905,9 +1011,10 @@ class Model(object):
             self.linkPage.after(2500,self.wipeErrorLabels)
             return
         else:
-            if node1.linkToNode(node2.number): # returns false if nodes already linked
-                node2.linkToNode(node1.number)
+            if node1.linkToNode(node2.number,num): # returns false if nodes already linked
+                node2.linkToNode(node1.number,num)
                 self._Links[num] = FEALinkLink.Link(num,node1,node2,material)
+                self.markEdited([num])
                 self.updateLinkList()
             else:
                 self.linkErrorLabel.config(text="Error: Nodes already linked")
@@ -935,7 +1042,8 @@ class Model(object):
             link = self._Links[num]
             link.node1.disconnectFromNode(link.node2.number)
             link.node2.disconnectFromNode(link.node1.number)
-            del self._Links[num]
+            self._Links.pop(num).release()
+            self.markEdited([num])
             self.updateLinkList()
         else:
             self.linkErrorLabel.config(fg="blue",text="Note: Link number does not exist to delete")
@@ -1009,9 +1117,9 @@ class Model(object):
             self.linkPage.after(2500,wipeErrorLabels)
             return
 
-        # make links (but don't include them in list of links yet, in case we run into an error)
+        # check every link number before making any link, as each new link takes a row of the link store
         linkNum = linkStartNum
-        newLinks = dict()
+        pairs = list()
         for nodeNum in range(lower,(upper+1)-nodeSpacing):
             if nodeNum in self._Nodes and nodeNum+nodeSpacing in self._Nodes:
                 node1 = self._Nodes[nodeNum]
@@ -1021,14 +1129,16 @@ class Model(object):
                         self.linkErrorLabel.config(text="MultiLink Error: Link number to be created already exists")
                         self.linkPage.after(2500,self.wipeErrorLabels)
                         return
-                    newLinks[linkNum] = FEALinkLink.Link(linkNum,node1,node2,mat)
+                    pairs.append((linkNum,node1,node2))
                     linkNum = linkNum + linkSpacing
 
-        # link nodes
-        for num,link in newLinks.items():
+        # make links and link nodes
+        for num,node1,node2 in pairs:
+            link = FEALinkLink.Link(num,node1,node2,mat)
             self._Links[num] = link
-            link.node1.linkToNode(link.node2.number)
-            link.node2.linkToNode(link.node1.number)
+            link.node1.linkToNode(link.node2.number,num)
+            link.node2.linkToNode(link.node1.number,num)
+            self.markEdited([num])
         
         self.updatePlot()
         self.updateLinkList()
@@ -1094,6 +1204,7 @@ class Model(object):
                 self._Nodes[num].addConstraints(xcon,ycon)
             else:
                 self._Nodes[num].addConstraints(xcon,ycon,zcon)
+            self.markEdited(structure=True)
         else:
             self.conErrorLabel.config(text="Error: Node number not defined")
             self.constrainPage.after(2500,self.wipeErrorLabels)
@@ -1119,6 +1230,7 @@ class Model(object):
         if num in self._Nodes:
             if self._Nodes[num].isConstrained():
                 self._Nodes[num].deleteConstraints()
+                self.markEdited(structure=True)
             else:
                 self.conErrorLabel.config(fg="blue",text="Note: No constraints at node to delete")
                 self.constrainPage.after(2500,self.wipeErrorLabels)
@@ -1201,6 +1313,7 @@ class Model(object):
                 self._Nodes[num].addForce(x,y)
             else:
                 self._Nodes[num].addForce(x,y,z)
+            self.markEdited()
         else:
             self.forceErrorLabel.config(text="Error: Node number not defined")
             self.forcePage.after(2500,self.wipeErrorLabels)
@@ -1225,6 +1338,7 @@ class Model(object):
         if num in self._Nodes:
             if self._Nodes[num].hasForce():
                 self._Nodes[num].deleteForce()
+                self.markEdited()
             else:
                 self.forceErrorLabel.config(fg="blue",text="Note: No forces at node to delete")
                 self.forcePage.after(2500,self.wipeErrorLabels)
@@ -1259,32 +1373,312 @@ class Model(object):
             maxForce = max(maxForce,node.forceMagnitude())
         return maxForce
 
+#---Load Cases---
+    def addLoadCase(self,name): # stores the current nodal forces as a named load case, returns true if one was replaced
+        case = dict() # node number -> force components
+        for num,node in self._Nodes.items():
+            if node.hasForce():
+                if self.dimensions == 2:
+                    case[num] = [node.xforce,node.yforce]
+                else:
+                    case[num] = [node.xforce,node.yforce,node.zforce]
+
+        replaced = name in self._LoadCases
+        self._LoadCases[name] = case
+        self.markEdited(structure=True) # the solution carries one column per load case
+        return replaced
+
+    def deleteLoadCase(self,name): # returns false if the load case does not exist
+        if name not in self._LoadCases:
+            return False
+        del self._LoadCases[name]
+        self.markEdited(structure=True)
+        return True
+
+    def useLoadCase(self,name): # replaces the nodal forces with those of a load case, returns false if it does not exist
+        if name not in self._LoadCases:
+            return False
+        for num,node in self._Nodes.items():
+            node.deleteForce()
+        for num,force in self._LoadCases[name].items():
+            if num in self._Nodes:
+                self._Nodes[num].addForce(*force)
+        self.markEdited()
+        return True
+
+#---Bulk Building---
+    # array based editing for scripts and model generators, nothing is drawn until refreshInterface()
+    # every call checks all of its input before changing the model and raises ValueError on bad input
+    def getNumbers(self,numbers,kind,existing): # validated integer numbers, unique and new or already existing
+        numbers = np.asarray(numbers)
+        if numbers.ndim != 1 or (len(numbers) and not np.issubdtype(numbers.dtype,np.integer)):
+            raise ValueError(kind + " numbers must be a 1d array of integers")
+        numbers = numbers.astype(int)
+        if len(np.unique(numbers)) != len(numbers):
+            raise ValueError("Repeated " + kind.lower() + " numbers")
+        known = np.isin(numbers,np.fromiter(existing,dtype=int,count=len(existing)))
+        return numbers,known
+
+    def getRows(self,values,numRows,kind): # validated finite float array with one row of dimension values per entry
+        values = np.asarray(values,dtype=float)
+        if values.shape != (numRows,self.dimensions):
+            raise ValueError("%s must have shape (%d,%d)" % (kind,numRows,self.dimensions))
+        if not np.all(np.isfinite(values)):
+            raise ValueError(kind + " must be finite")
+        return values
+
+    def getCoincident(self,numbers,coordinates,moved=()): # numbers of the given nodes that would lie on another node
+        # the array pass picks the few positions near another one, only those are looked up in NodeGrids
+        moved = set(moved) # nodes whose old positions do not count
+        others = [num for num in self._Nodes if num not in moved]
+        coincident = set()
+        near = FEALinkNode.getNearRows(coordinates,FEALinkNode.getNodeArrays(self._Nodes,others,self.dimensions)[0])
+        if len(near):
+            grid = self.getNodeGrid()
+            for row in near.tolist():
+                if any(num not in moved for num in grid.findAll(coordinates[row])):
+                    coincident.add(numbers[row])
+        near = FEALinkNode.getNearRows(coordinates) # rows of the same call on each other
+        if len(near):
+            grid = FEALinkNode.NodeGrid(dimensions=self.dimensions)
+            for row in near.tolist():
+                grid.add(numbers[row],coordinates[row])
+            for row in near.tolist():
+                if grid.find(coordinates[row],ignore=numbers[row]) is not None:
+                    coincident.add(numbers[row])
+        return sorted(coincident)
+
+    def addMaterials(self,numbers,modulus,area,density=0):
+        numbers,known = self.getNumbers(numbers,"Material",self._Materials)
+        if np.any(known):
+            raise ValueError("Material numbers already exist: %s" % numbers[known][:10].tolist())
+        modulus,area,density = [np.broadcast_to(np.asarray(value,dtype=float),numbers.shape) for value in [modulus,area,density]]
+        if np.any(modulus <= 0):
+            raise ValueError("Young's Modulus must be positive")
+        if np.any(area <= 0):
+            raise ValueError("Area must be positive")
+        for num,E,A,D in zip(numbers.tolist(),modulus.tolist(),area.tolist(),density.tolist()):
+            self._Materials[num] = FEALinkMaterial.Material(num,E,A,D)
+        return
+
+    def addNodes(self,numbers,coordinates):
+        numbers,known = self.getNumbers(numbers,"Node",self._Nodes)
+        if np.any(known):
+            raise ValueError("Node numbers already exist: %s" % numbers[known][:10].tolist())
+        coordinates = self.getRows(coordinates,len(numbers),"Coordinates")
+        if len(numbers) == 0:
+            return
+        numbers = numbers.tolist()
+        coincident = self.getCoincident(numbers,coordinates)
+        if coincident:
+            raise ValueError("Nodes on other nodes: %s" % coincident[:10])
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._Nodes.update(zip(numbers,self._NodeStore.addNodes(numbers,coordinates)))
+            if self._NodeGrid is not None:
+                for num,position in zip(numbers,coordinates.tolist()):
+                    self._NodeGrid.add(num,position)
+        finally:
+            if collecting:
+                gc.enable()
+        for corner in [coordinates.min(axis=0),coordinates.max(axis=0)]: # the bounding box stands in for every node
+            self._Scope.expandScope(FEALinkNode.Node(None,*corner.tolist()))
+        self.markEdited(structure=True)
+        return
+
+    def addLinks(self,numbers,nodePairs,materials=0):
+        numbers,known = self.getNumbers(numbers,"Link",self._Links)
+        if np.any(known):
+            raise ValueError("Link numbers already exist: %s" % numbers[known][:10].tolist())
+        nodePairs = np.asarray(nodePairs)
+        if nodePairs.shape != (len(numbers),2) or (len(numbers) and not np.issubdtype(nodePairs.dtype,np.integer)):
+            raise ValueError("Node pairs must be an integer array of shape (%d,2)" % len(numbers))
+        materials = np.broadcast_to(np.asarray(materials),numbers.shape)
+        if len(numbers) == 0:
+            return
+        nodePairs = nodePairs.astype(int)
+        missing = ~np.isin(nodePairs,np.fromiter(self._Nodes,dtype=int,count=len(self._Nodes)))
+        if np.any(missing):
+            raise ValueError("Invalid node numbers: %s" % np.unique(nodePairs[missing])[:10].tolist())
+        if np.any(nodePairs[:,0] == nodePairs[:,1]):
+            raise ValueError("Cannot link node to itself")
+        if not np.all(np.isin(materials,np.fromiter(self._Materials,dtype=int,count=len(self._Materials)))):
+            raise ValueError("Invalid material")
+        if len(np.unique(np.sort(nodePairs,axis=1),axis=0)) != len(nodePairs):
+            raise ValueError("Nodes linked more than once")
+        nodes1 = [self._Nodes[num] for num in nodePairs[:,0].tolist()]
+        nodes2 = [self._Nodes[num] for num in nodePairs[:,1].tolist()]
+        for node1,node2 in zip(nodes1,nodes2):
+            if node2.number in node1.linkedNodes:
+                raise ValueError("Nodes already linked: %d %d" % (node1.number,node2.number))
+
+        numbers = numbers.tolist() # one int object per link number, shared by the dictionaries and views
+        collecting = gc.isenabled()
+        gc.disable() # only new objects are made, cyclic collection passes over them would double the time
+        try:
+            for num,node1,node2 in zip(numbers,nodes1,nodes2):
+                node1.linkedNodes[node2.number] = num
+                node2.linkedNodes[node1.number] = num
+            links = FEALinkLink.getLinkStore(self._NodeStore).addLinks(numbers,nodes1,nodes2,
+                                                                        [self._Materials[mat] for mat in materials.tolist()])
+            self._Links.update(zip(numbers,links))
+        finally:
+            if collecting:
+                gc.enable()
+        self.markEdited(numbers)
+        return
+
+    def moveNodes(self,numbers,coordinates): # new positions for existing nodes, their links are measured again in one pass
+        numbers,known = self.getNumbers(numbers,"Node",self._Nodes)
+        if not np.all(known):
+            raise ValueError("Node number not defined: %s" % numbers[~known][:10].tolist())
+        coordinates = self.getRows(coordinates,len(numbers),"Coordinates")
+        if len(numbers) == 0:
+            return
+        coincident = self.getCoincident(numbers.tolist(),coordinates,moved=numbers.tolist())
+        if coincident:
+            raise ValueError("Nodes on other nodes: %s" % coincident[:10])
+        nodes = [self._Nodes[num] for num in numbers.tolist()]
+        self._NodeStore.moveRows([node.row for node in nodes],coordinates)
+        if self._NodeGrid is not None:
+            for num,position in zip(numbers.tolist(),coordinates.tolist()):
+                self._NodeGrid.remove(num)
+                self._NodeGrid.add(num,position)
+        for corner in [coordinates.min(axis=0),coordinates.max(axis=0)]:
+            self._Scope.expandScope(FEALinkNode.Node(None,*corner.tolist()))
+        self.markEdited([num for node in nodes for num in node.getLinks()])
+        return
+
+    def setConstraints(self,numbers,mask,values=0): # replaces the constraints of the nodes, unmasked directions are free
+        numbers,known = self.getNumbers(numbers,"Node",self._Nodes)
+        if not np.all(known):
+            raise ValueError("Node number not defined: %s" % numbers[~known][:10].tolist())
+        mask = np.asarray(mask,dtype=bool)
+        if mask.shape != (len(numbers),self.dimensions):
+            raise ValueError("Mask must have shape (%d,%d)" % (len(numbers),self.dimensions))
+        values = self.getRows(np.broadcast_to(values,mask.shape),len(numbers),"Constraint values")
+        for num,constrained,value in zip(numbers.tolist(),mask.tolist(),values.tolist()):
+            self._Nodes[num].addConstraints(*[v if c else None for c,v in zip(constrained,value)])
+        self.markEdited(structure=True)
+        return
+
+    def setForces(self,numbers,forces):
+        numbers,known = self.getNumbers(numbers,"Node",self._Nodes)
+        if not np.all(known):
+            raise ValueError("Node number not defined: %s" % numbers[~known][:10].tolist())
+        forces = self.getRows(forces,len(numbers),"Forces")
+        for num,force in zip(numbers.tolist(),forces.tolist()):
+            self._Nodes[num].addForce(*force)
+        self.markEdited()
+        return
+
+    def setLoadCase(self,name,numbers,forces): # stores the forces on the nodes as a named load case, replacing one of that name
+        if name == "":
+            raise ValueError("Load case requires a name")
+        numbers,known = self.getNumbers(numbers,"Node",self._Nodes)
+        if not np.all(known):
+            raise ValueError("Node number not defined: %s" % numbers[~known][:10].tolist())
+        forces = self.getRows(forces,len(numbers),"Forces")
+        self._LoadCases[name] = dict(zip(numbers.tolist(),forces.tolist()))
+        self.markEdited(structure=True) # the solution carries one column per load case
+        return
+
+    def refreshInterface(self): # redraws lists and plot after bulk edits, does nothing for headless models
+        if self.gui:
+            self.updateLists()
+            self.updatePlot()
+        return
+
+#---Command Scripts---
+    def runScript(self,filename,solver=None): # runs a command file as one edit, returns its errors and the solve/save messages
+        # the script is checked in full first and changes nothing if any line has an error, otherwise the
+        # lists and plot are redrawn once at the end instead of after every command
+        script = FEALinkScript.Script(self)
+        errors = script.run(FEALinkScript.readScript(filename))
+        if errors:
+            return errors,[]
+        script.commit()
+        messages = script.finish(solver)
+        self.refreshInterface()
+        return [],messages
+
 #---Solution---
-    def solve(self,event=None):
-        self._Solution = None
+    def markEdited(self,links=[],structure=False): # records what the next solve has to redo
+        self._EditedLinks.update(links)
+        if structure:
+            self._StructureEdited = True
+        self._Connectivity = None # connectivity and support check, rerun by the next full solve
+        self._ModelHash = None
+        return
 
+    def solve(self,event=None,solver=None):
         self.solErrorLabel.config(text="Solving...",fg="green")
-        self._Solution = FEALinkSolution.Solution(self)
-        try:
-            message = self._Solution.solve()
-            if message == "Success":
+        message = self.solveModel(solver)
+        if message == "Success":
+            if len(self._LoadCases) == 0:
                 self.solErrorLabel.config(text="Solution Completed",fg="green")
-                self.solutionPage.after(2500,self.wipeErrorLabels)
-                self.updateSolutionNotebook()
-                self.plotExagCheck.config(state=NORMAL)
-                self.plotResultCheck.config(state=NORMAL)
-                self.showStressCheck.config(state=NORMAL)
             else:
-                self._Solution = None
-                self.solErrorLabel.config(text=message,fg="red")
-                self.solErrorLabel.after(2500,self.wipeErrorLabels)
-                self.wipeSolutionNotebook()
-        except:
-            self._Solution = None
-            self.solErrorLabel.config(text="Solve Failed",fg="red")
+                self.solErrorLabel.config(text="Solution Completed (%d load cases)" % len(self._LoadCases),fg="green")
             self.solutionPage.after(2500,self.wipeErrorLabels)
+            self.updateSolutionNotebook()
+            self.plotExagCheck.config(state=NORMAL)
+            self.plotResultCheck.config(state=NORMAL)
+            self.showStressCheck.config(state=NORMAL)
+        else:
+            self.solErrorLabel.config(text=message,fg="red")
+            self.solErrorLabel.after(2500,self.wipeErrorLabels)
             self.wipeSolutionNotebook()
-        return
+        return message
+
+    def solveModel(self,solver=None): # solves without touching the interface, returns the solution message
+        try:
+            modelHash = self._ModelHash
+            if modelHash is None: # edited since the last solve
+                modelHash = FEALinkSolution.getModelHash(self)
+                self._ModelHash = modelHash
+            if self._Solution is not None and self._Solution.modelHash == modelHash:
+                cached = self._Solution # nothing the solution depends on changed since the last solve
+            else:
+                cached = self._SolutionCache.get(modelHash,self) # None unless the model is back in a state solved before
+            if cached is not None:
+                self._Solution = cached
+                self._Solution.setModelSize(self._Scope.modelSize)
+                self._Connectivity = self._Solution.connectivity
+                message = "Success"
+            elif self._Solution is not None and not self._StructureEdited:
+                # only links or forces changed, so the last factorization is updated instead of redone
+                self._Solution.modelSize = self._Scope.modelSize
+                self._Solution.connectivity = self._Connectivity
+                if len(self._EditedLinks) == 0:
+                    message = self._Solution.resolve()
+                else:
+                    message = self._Solution.updateLinks(self._EditedLinks)
+                self._Connectivity = self._Solution.connectivity
+            else:
+                message = None
+                if self._Solution is not None:
+                    # nodes, constraints or load cases changed, the stiffness matrix is patched for the edited links
+                    self._Solution.modelSize = self._Scope.modelSize
+                    self._Solution.connectivity = self._Connectivity
+                    message = self._Solution.reassemble(self._EditedLinks)
+                if message is None:
+                    self._Solution = FEALinkSolution.Solution(self)
+                    message = self._Solution.solve(solver)
+                self._Connectivity = self._Solution.connectivity
+            self._EditedLinks = set()
+            self._StructureEdited = False
+        except:
+            message = "Solve Failed"
+        if message == "Success":
+            self._Solution.modelHash = modelHash
+            self._SolutionCache.put(self._Solution)
+        else:
+            if self._Solution is not None: # a failed update may have changed it, so it is not reused for the old state
+                self._SolutionCache.discard(self._Solution)
+            self._Solution = None
+            self._StructureEdited = True
+        return message
 
     def updateSolutionNotebook(self):
         self.nodalListTree.delete(*self.nodalListTree.get_children())
@@ -1312,6 +1706,7 @@ class Model(object):
                 self.massListTree.insert("",'end',text=num,values=('%.8g' % self._Solution._Length[num],""))
             else:
                 self.massListTree.insert("",'end',text=num,values=('%.8g' % self._Solution._Length[num],'%.8g' % self._Solution._Mass[num]))
+        self.solutionListed = True
         return
 
     def wipeSolutionNotebook(self):
@@ -1349,6 +1744,7 @@ class Model(object):
             self.display.set_xlabel('x')
             self.display.set_ylabel('y')
         else:
+            from mpl_toolkits.mplot3d import Axes3D # registers the 3d projection, only needed by 3d models
             self.display = self.fig.add_subplot(111,projection='3d')
             self.display.plot([],[],[])
             self.display.set_xlabel('x')
@@ -1407,6 +1803,7 @@ class Model(object):
         # make Notebook widget
         self.notebook = ttk.Notebook(self.root,name="actions",width=500,height=500)
         self.notebook.pack(side=LEFT)
+        self.notebook.bind('<<NotebookTabChanged>>',self.on_tab_changed)
 
         # Notes
         self.notePage = Frame(self.notebook,name="notes")
@@ -2033,10 +2430,7 @@ class Model(object):
         
         self.updateNotes()
 
-        file = open(str(self.name),'wb')
-        modelInfo = [self.name,self.dimensions,self._Materials,self._Nodes,self._Links,self._Scope,self._Solution,self.units,self.notes]
-        pickle.dump(modelInfo,file,protocol=pickle.HIGHEST_PROTOCOL)
-        file.close()
+        FEALinkFile.writeModelFile(self.name,self)
         return
 
     def saveAs(self):
@@ -2047,16 +2441,16 @@ class Model(object):
         self.commandLine.focus()
         self.commandLine.select_range(0,END)
         self.root.title(self.name)
-        file = open(str(self.name),'wb')
-        modelInfo = [self.name,self.dimensions,self._Materials,self._Nodes,self._Links,self._Scope,self._Solution,self.units,self.notes]
-        pickle.dump(modelInfo,file,protocol=pickle.HIGHEST_PROTOCOL)
-        file.close()
+        FEALinkFile.writeModelFile(self.name,self)
         return
 
     def load(self,filename):
-        file = open(str(filename),'rb')
-        modelInfo = pickle.load(file)
-        file.close()
+        if FEALinkFile.isModelFile(filename):
+            modelInfo = FEALinkFile.readModelFile(filename)
+        else: # pickled by older versions, see FEALinkFile.py for converting them
+            file = open(str(filename),'rb')
+            modelInfo = pickle.load(file)
+            file.close()
 
         self.name = filename
         self.dimensions = modelInfo[1]
@@ -2074,18 +2468,37 @@ class Model(object):
             print('failure loading units or notes info')
             self.units = {'mass':'kg','length':'m','time':'s'}
             self.notes = ""
+        try:
+            self._LoadCases = modelInfo[9]
+        except:
+            self._LoadCases = dict()
         for num, mat in self._Materials.items():
             if not hasattr(mat,'density'): 
                 mat.density = 0
+        self._NodeStore = FEALinkNode.gatherNodes(self._Nodes,self.dimensions) # nodes of older versions each have their own
+        FEALinkLink.gatherLinks(self._Links,self._NodeStore)
+        if any(isinstance(node.linkedNodes,list) for node in self._Nodes.values()): # linked node lists, without link numbers
+            for node in self._Nodes.values():
+                node.linkedNodes = dict()
+            for num,link in self._Links.items():
+                link.node1.linkedNodes[link.node2.number] = num
+                link.node2.linkedNodes[link.node1.number] = num
+        if self._Solution is not None and not hasattr(self._Solution,'results'):
+            self._Solution.convertLegacyResults() # solutions saved as per-node and per-link objects
         if self._Solution is not None and not hasattr(self._Solution,'totalMass'):
             self._Solution.totalMass = 0
             self._Solution.totalLength = 0
             self._Solution._Length = dict()
             self._Solution._Mass = dict()
+        if self._Solution is not None and not hasattr(self._Solution,'modelHash'):
+            self._Solution.modelHash = None # solved before model hashing, so the next solve starts over
+        if self._Solution is not None and not hasattr(self._Solution,'solver'):
+            self._Solution.solver = None # assembled with constraint penalties, the matrices cannot be patched
+            self._Solution.K = None
 
         return
 
-    def __init__(self,dimensions=None,load=False,filename=None):
+    def __init__(self,dimensions=None,load=False,filename=None,gui=True):
         if load:
             self.load(filename)
         else:
@@ -2094,15 +2507,29 @@ class Model(object):
 
             self._Materials = dict() # materials dictionary: number->FEALinkMaterial.Material
             self._Nodes = dict() # nodes dictionary: number->FEALinkNode.Node
+            self._NodeStore = FEALinkNode.NodeStore(self.dimensions) # coordinates, constraints and forces the nodes are views of
             self._Links = dict() # links dictionary: number->FEALinkLink.Link
             self._Scope = FEALinkScope.Scope(self.dimensions) # will be defined as FEALinkScope.Scope object in __init__
             self._Solution = None
+            self._LoadCases = dict() # load case name -> {node number: force components}
             self.units = {'mass':'kg','length':'m','time':'s'}
             self.notes = ""
 
         self._CommandList = list()
         self.commandIndex = -1
+        self._EditedLinks = set() # links added, removed or changed since the last solve
+        self._StructureEdited = True # nodes, constraints or load cases changed, so the next solve starts over
+        self._Connectivity = None # cached FEALinkSolution connectivity check
+        self._ModelHash = None # FEALinkSolution.getModelHash() of the model, kept until the next edit
+        self._NodeGrid = None # FEALinkNode.NodeGrid of the node positions, built when first needed
+        self._SolutionCache = FEALinkSolution.SolutionCache() # recently solved model states by content hash
+        self.gui = gui
+        self.solutionListed = False # result tables filled for the current solution
+        if not gui: # headless model for scripts and batch runs, only the data and solveModel() are used
+            return
 
+        loadInterface()
+        loadPlotting()
         self.root = Toplevel()
         if self.dimensions == 2:
             self.root.title(self.name)
@@ -4,13 +4,139 @@
 #
 # This module implements the Node class
 
-import matplotlib
-from mpl_toolkits.mplot3d import Axes3D
+import math
+import itertools
 import FEALinkScope
 import numpy as np
-import Arrow3D
+
+_tolerance = 1e-6 # nodes closer than this in every coordinate are in the same location
+
+class NodeStore(object):
+    # columnar node data, each Node is a view of one row, rows of deleted nodes are reused
+    def addRows(self,count): # first of count new rows at the end, they start out free and unloaded
+        start = self.size
+        if start+count > len(self.coordinates):
+            self.grow(max(16,2*(start+count)))
+        self.size += count
+        return start
+
+    def addRow(self,position):
+        if self.freeRows:
+            row = self.freeRows.pop()
+            self.constraints[row] = np.nan
+            self.forces[row] = 0
+        else:
+            row = self.addRows(1)
+        self.coordinates[row] = position
+        self.moved += 1
+        return row
+
+    def releaseRow(self,row):
+        self.freeRows.append(row)
+        return
+
+    def moveRows(self,rows,coordinates): # new positions for many nodes at once
+        self.coordinates[rows] = coordinates
+        self.moved += 1
+        return
+
+    def addNodes(self,numbers,coordinates): # views for a block of new nodes
+        start = self.addRows(len(numbers))
+        self.coordinates[start:start+len(numbers)] = coordinates
+        self.moved += 1
+        nodes = list()
+        for row,num in enumerate(numbers,start):
+            node = Node.__new__(Node)
+            node.number = num
+            node.store = self
+            node.row = row
+            node.linkedNodes = dict()
+            nodes.append(node)
+        return nodes
+
+    def grow(self,capacity):
+        for name,fill in [('coordinates',0),('constraints',np.nan),('forces',0)]:
+            old = getattr(self,name)
+            new = np.full([capacity,self.dimensions],fill,dtype=float)
+            new[:len(old)] = old
+            setattr(self,name,new)
+        return
+
+    def __init__(self,dimensions):
+        self.dimensions = dimensions
+        self.coordinates = np.zeros([0,dimensions])
+        self.constraints = np.zeros([0,dimensions]) # prescribed displacements, NaN in free directions
+        self.forces = np.zeros([0,dimensions])
+        self.size = 0 # rows handed out so far
+        self.freeRows = list() # rows of deleted nodes
+        self.moved = 0 # counts coordinate changes, so link geometry made from them can tell it is out of date
+        self.links = None # FEALinkLink.LinkStore of the links between these nodes, made with the first link
+        return
+
+def storeProperty(name,k,free=False): # node attribute kept in column k of a NodeStore array
+    def get(node):
+        if k >= node.store.dimensions:
+            raise AttributeError("2D node has no z values")
+        value = getattr(node.store,name).item(node.row,k)
+        if free and value != value: # NaN marks a free direction
+            return None
+        return value
+    def set(node,value):
+        if k >= node.store.dimensions:
+            raise AttributeError("2D node has no z values")
+        if free and value is None:
+            value = np.nan
+        getattr(node.store,name)[node.row,k] = value
+        if name == 'coordinates':
+            node.store.moved += 1
+    return property(get,set)
+
+def gatherNodes(nodes,dimensions): # store the nodes are views of, nodes of older versions are moved into a new one
+    store = None
+    for node in nodes.values():
+        store = node.store
+        break
+    if store is not None and all(node.store is store for node in nodes.values()):
+        return store
+    store = NodeStore(dimensions)
+    for node in nodes.values():
+        node.moveToStore(store)
+    return store
+
+def getCellKeys(cells): # one comparable value per row of NodeGrid cell indices
+    cells = np.ascontiguousarray(cells)
+    return cells.view(np.dtype((np.void,cells.dtype.itemsize*cells.shape[1]))).ravel()
+
+def getNearRows(coordinates,others=None,tolerance=_tolerance): # rows that may lie within tolerance of a row of others, or of another row
+    # only rows in neighboring NodeGrid cells can, so this is an array pass before the exact NodeGrid search
+    coordinates = np.asarray(coordinates,dtype=float)
+    cells = np.floor(coordinates/tolerance).astype(np.int64)
+    if others is None:
+        reference,inverse,counts = np.unique(getCellKeys(cells),return_inverse=True,return_counts=True)
+        near = counts[inverse.ravel()] > 1 # rows sharing a cell
+    else:
+        reference = getCellKeys(np.floor(np.asarray(others,dtype=float)/tolerance).astype(np.int64))
+        near = np.zeros(len(cells),dtype=bool)
+    for offset in itertools.product((0,-1,1),repeat=cells.shape[1]):
+        if others is None and not any(offset):
+            continue
+        near |= np.isin(getCellKeys(cells+offset),reference)
+    return np.flatnonzero(near)
+
+def getNodeArrays(nodes,numbers,dimensions): # coordinates, constraints and forces of the numbered nodes, rows follow numbers
+    views = [nodes[num] for num in numbers]
+    if len(views) == 0:
+        return tuple(np.zeros([0,dimensions]) for k in range(3))
+    store = views[0].store
+    if all(node.store is store for node in views):
+        rows = np.array([node.row for node in views],dtype=int)
+        return store.coordinates[rows],store.constraints[rows],store.forces[rows]
+    # nodes made on their own and put into the model directly
+    return tuple(np.array([getattr(node.store,name)[node.row] for node in views]) for name in ['coordinates','constraints','forces'])
 
 class Node(object):
+    __slots__ = ('number','store','row','linkedNodes')
+
     def addConstraints(self,x=None,y=None,z=None):
         self.xconstrain = x
         self.yconstrain = y
@@ -127,6 +253,7 @@ class Node(object):
 
         # 3D plot
         else:
+            import Arrow3D # matplotlib arrow artists are loaded with the first 3d plot
             display.plot([self.x],[self.y],[self.z],'k.')
             if showNumbers:
                 display.text(self.x,self.y,self.z,'%s' % str(self.number),size=11,zorder=1)
@@ -191,67 +318,134 @@ class Node(object):
                 display.add_artist(arrow)
         return
 
-    def linkToNode(self,num): # returns false if already linked to that node 
+    def linkToNode(self,num,link): # returns false if already linked to that node, link is the number of the joining link
         if num in self.linkedNodes:
             return False
         else:
-            self.linkedNodes.append(num)
+            self.linkedNodes[num] = link
         return True
 
     def disconnectFromNode(self,num):
-        self.linkedNodes.remove(num)
+        del self.linkedNodes[num]
         return
 
+    def getLinks(self): # numbers of the links attached to this node
+        return list(self.linkedNodes.values())
+
     def isLinked(self):
         if len(self.linkedNodes) != 0:
             return True
         return False
 
-    def addSolution(self,displacement,reaction): # nodes with solutions will only exist in the list as part of the Solution class
-        self.xdisp = displacement[0]
-        self.xsol = self.x + self.xdisp
-        if self.xconstrain != None:
-            self.xreact = reaction[0]
-        else:
-            self.xreact = 0
-
-        self.ydisp = displacement[1]
-        self.ysol = self.y + self.ydisp
-        self.yreact = reaction[1] - self.yforce
-        if self.yconstrain != None:
-            self.yreact = reaction[1]
-        else:
-            self.yreact = 0
+    def getPosition(self): # coordinates as a tuple, 2 or 3 long
+        if self.dimensions == 2:
+            return (self.x,self.y)
+        return (self.x,self.y,self.z)
 
-        if self.dimensions == 3:
-            self.zdisp = displacement[2]
-            self.zsol = self.z + self.zdisp
-            if self.zconstrain != None:
-                self.zreact = reaction[2]
-            else:
-                self.zreact = 0
+    def release(self): # hands the row back to the store once the node is deleted from its model
+        self.store.releaseRow(self.row)
+        return
 
+    def moveToStore(self,store): # copies the node's values into a new row of another store
+        row = store.addRow(self.store.coordinates[self.row])
+        store.constraints[row] = self.store.constraints[self.row]
+        store.forces[row] = self.store.forces[self.row]
+        self.release()
+        self.store = store
+        self.row = row
         return
 
     def __str__(self):
         output = "Node __str__ function not yet implemented"
         return output
 
-    def __init__(self,num,x,y,z=None):
-        self.number = num
-        self.x = x
-        self.y = y
-        self.xconstrain = None
-        self.yconstrain = None
-        self.xforce = 0
-        self.yforce = 0
+    x = storeProperty('coordinates',0)
+    y = storeProperty('coordinates',1)
+    z = storeProperty('coordinates',2)
+    xconstrain = storeProperty('constraints',0,free=True)
+    yconstrain = storeProperty('constraints',1,free=True)
+    zconstrain = storeProperty('constraints',2,free=True)
+    xforce = storeProperty('forces',0)
+    yforce = storeProperty('forces',1)
+    zforce = storeProperty('forces',2)
+    dimensions = property(lambda self: self.store.dimensions)
+
+    def __getstate__(self):
+        return (self.number,self.store,self.row,self.linkedNodes)
+
+    def __setstate__(self,state):
+        if isinstance(state,dict): # pickled by older versions with its own attributes, the model gathers these into one store
+            position = [state['x'],state['y']]
+            if 'z' in state:
+                position.append(state['z'])
+            self.__init__(state['number'],*position)
+            for a in ['x','y','z'][:len(position)]:
+                setattr(self,a+'constrain',state.get(a+'constrain'))
+                setattr(self,a+'force',state.get(a+'force',0))
+            self.linkedNodes = state.get('linkedNodes',dict())
+        else:
+            self.number,self.store,self.row,self.linkedNodes = state
+        return
 
+    def __init__(self,num,x,y,z=None,store=None):
+        if store is None: # a node on its own, the nodes of a model share the model's store
+            if z is None:
+                store = NodeStore(2)
+            else:
+                store = NodeStore(3)
+        self.number = num
+        self.store = store
         if z is None:
-            self.dimensions = 2
+            self.row = store.addRow([x,y])
         else: # only define z-direction if z given (indicating 3d model)
-            self.dimensions = 3
-            self.z = z
-            self.zconstrain = None
-            self.zforce = 0
+            self.row = store.addRow([x,y,z])
+        self.linkedNodes = dict() # number of each node this node is linked to -> number of the link between them
+
+class NodeGrid(object): # spatial hash of node positions, finds a node near a location without scanning all nodes
+    def getCell(self,position):
+        return tuple(int(math.floor(x/self.tolerance)) for x in position)
+
+    def add(self,num,position):
+        position = tuple(float(x) for x in position)
+        cell = self.getCell(position)
+        self.cells.setdefault(cell,dict())[num] = position
+        self.nodeCells[num] = cell
+        return
+
+    def remove(self,num):
+        cell = self.nodeCells.pop(num,None)
+        if cell is not None:
+            entries = self.cells[cell]
+            del entries[num]
+            if len(entries) == 0:
+                del self.cells[cell]
+        return
 
-        self.linkedNodes = list() # list of nodes this node is linked to
+    def find(self,position,ignore=None): # number of a node within tolerance of position, or None
+        for num in self.findAll(position):
+            if num != ignore:
+                return num
+        return None
+
+    def findAll(self,position): # numbers of all nodes within tolerance of position
+        position = tuple(float(x) for x in position)
+        cell = self.getCell(position)
+        found = list()
+        for offset in self.offsets: # cells are one tolerance wide, so a match can only be in a neighboring cell
+            entries = self.cells.get(tuple(c+o for c,o in zip(cell,offset)))
+            if entries is None:
+                continue
+            for num,other in entries.items():
+                if max(abs(a-b) for a,b in zip(position,other)) <= self.tolerance:
+                    found.append(num)
+        return found
+
+    def __init__(self,nodes=None,dimensions=2,tolerance=_tolerance):
+        self.tolerance = tolerance
+        self.offsets = list(itertools.product((0,-1,1),repeat=dimensions))
+        self.cells = dict() # cell index -> {node number: position}
+        self.nodeCells = dict() # node number -> cell index, so moved nodes can still be removed
+        if nodes is not None:
+            for num,node in nodes.items():
+                self.add(num,node.getPosition())
+        return
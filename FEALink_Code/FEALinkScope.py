@@ -30,11 +30,11 @@ class Scope(object):
 			return
 
 		for num,node in nodes.items():
-			if self.xmin == None:
-				self.xmin = node.x
-				self.ymin = node.y
+			if self.xmin == None: # the first node starts both limits
+				self.xmin = self.xmax = node.x
+				self.ymin = self.ymax = node.y
 				if self.dimensions == 3:
-					self.zmin = node.z
+					self.zmin = self.zmax = node.z
 
 			self.xmin = min(self.xmin,node.x)
 			self.ymin = min(self.ymin,node.y)
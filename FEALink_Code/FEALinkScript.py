@@ -0,0 +1,465 @@
+# FEALinkScript
+#
+# This module implements command scripts, files of command line commands run as a single edit of a model
+#
+# usage: python FEALinkScript.py [-d {2,3} | -m MODEL] [-o OUTPUT] [--solver SOLVER] SCRIPT [...]
+#
+# Every line of a script is a command as typed on the model command line, blank lines and lines starting
+# with '#' are skipped.  The whole script is checked against a copy of the model first and nothing changes
+# if any line has an error, all of them are reported with their line numbers.  Otherwise the edits are
+# applied at once, solve and save commands run after them in script order, and the interface is redrawn
+# a single time.  Display and quit commands are ignored in scripts.
+#
+# Run as a script it builds or edits models without a window: a new model of the given dimensions, or
+# the saved MODEL, has every SCRIPT run on it and is written to OUTPUT if given.
+
+import sys
+import copy
+import argparse
+import numpy as np
+import FEALinkMaterial
+import FEALinkNode
+import FEALinkLink
+import FEALinkSolution
+import FEALinkFile
+
+# commands of the model command line that only change the display, skipped in scripts
+_ignoredCommands = ['nn','nodenumbers','ln','linknumbers','sf','showforce','showforces','sc','showconstrain','showconstraint',
+                    'showconstraints','update','plot','up','updateplot','replot','rp','pe','ex','plotexaggerated','ed',
+                    'exaggerateddeformation','ped','exag','p','pm','plotmodel','show','showmodel','sm','plotpreloadedmodel',
+                    'ppm','pplm','pr','plotresult','plotresults','sr','showresult','showresults','per','plotexact',
+                    'plotexactresults','ss','showstress','ps','plotstress','q','quit']
+
+def readScript(filename):
+    with open(str(filename),'r') as file:
+        return file.read().splitlines()
+
+def getNumberList(command,kind): # numbers of a delete command, given as a list or as a:b or a:step:b
+    try:
+        if len(command) == 1 and ":" in command[0]:
+            bounds = [int(x.strip()) for x in command[0].split(':')]
+            if len(bounds) == 3:
+                a,step,b = bounds
+            else:
+                a,b = bounds
+                step = 1
+            numbers = list(range(a,b,step))
+            numbers.append(b)
+            return numbers
+        return [int(x) for x in command if x != ""]
+    except ValueError:
+        raise ValueError(kind + " numbers must be integers, a:b or a:step:b")
+
+def getFloat(value,default,kind): # blank entries take the default
+    if value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError("Invalid " + kind)
+
+def getInteger(value,default,kind):
+    if value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(kind + " must be an integer")
+
+def fillCommand(command,length): # pads the optional trailing entries with blanks
+    if len(command) > length:
+        raise ValueError("Command sequence too long")
+    return command + [""]*(length-len(command))
+
+class Script(object):
+    # edits are checked and made on copies of the model's objects, commit() moves them into the model
+    def run(self,lines): # checks and applies every line, returns the errors
+        for lineNumber,text in enumerate(lines,1):
+            text = text.strip()
+            if text == "" or text.startswith('#'):
+                continue
+            command = [x.strip() for x in text.split(',')]
+            commandType = command[0].lower()
+            del command[0]
+            try:
+                self.execute(commandType,command)
+            except ValueError as error:
+                self.errors.append("line %d: %s" % (lineNumber,error))
+            self.commandCount += 1
+        return self.errors
+
+    def execute(self,commandType,command):
+        if commandType in ['m','material']:
+            self.newMaterial(command)
+        elif commandType in ['dm','deletematerial']:
+            self.deleteMaterials(getNumberList(command,"Material"))
+        elif commandType in ['n','node','createnode','newnode']:
+            self.newNode(command)
+        elif commandType in ['dn','deletenode']:
+            self.deleteNodes(getNumberList(command,"Node"))
+        elif commandType in ['l','link','createlink','newlink']:
+            self.newLink(command)
+        elif commandType in ['dl','deletelink']:
+            self.deleteLinks(getNumberList(command,"Link"))
+        elif commandType in ['c','d','constrain','constraint','displacement']:
+            self.addConstraint(command)
+        elif commandType in ['dc','dd','deleteconstraint','deleteconstrain','deletedisplacement']:
+            self.deleteConstraints(getNumberList(command,"Node"))
+        elif commandType in ['f','force','addforce']:
+            self.addForce(command)
+        elif commandType in ['df','deleteforce']:
+            self.deleteForces(getNumberList(command,"Node"))
+        elif commandType in ['lc','loadcase','addloadcase']:
+            self.addLoadCase(command)
+        elif commandType in ['dlc','deleteloadcase']:
+            self.deleteLoadCases(command)
+        elif commandType in ['ulc','useloadcase']:
+            self.useLoadCase(command)
+        elif commandType in ['mn','multinode','linnode','linearnode']:
+            self.linNode(command)
+        elif commandType in ['ml','multilink']:
+            self.multiLink(command)
+        elif commandType in ['s','solve']:
+            solver = fillCommand(command,1)[0]
+            if solver != "" and solver not in ['auto'] + FEALinkSolution.Solution._solvers:
+                raise ValueError("Unknown solver '" + solver + "'")
+            self.actions.append(('solve',solver or None))
+        elif commandType in ['save','saveas']:
+            filename = fillCommand(command,1)[0]
+            if filename == "" and self.model.name == "untitled" and not any(action == 'save' for action,value in self.actions):
+                raise ValueError("Save requires a file name for an untitled model")
+            self.actions.append(('save',filename or None))
+        elif commandType in _ignoredCommands:
+            pass
+        else:
+            raise ValueError("Invalid command '" + commandType + "'")
+        return
+
+    def getNextNumber(self,kind): # automatic numbering continues after the highest number, kept rather than searched for
+        if self.highest[kind] is None:
+            objects = getattr(self,kind)
+            self.highest[kind] = max(objects) if objects else -1
+        return self.highest[kind]+1
+
+    def addNumber(self,kind,num):
+        if self.highest[kind] is not None:
+            self.highest[kind] = max(self.highest[kind],num)
+        return
+
+#---Materials---
+    def newMaterial(self,command): # number, area, modulus and optionally density
+        num,A,E,D = fillCommand(command,4)
+        num = getInteger(num,self.getNextNumber('materials'),"Material number")
+        A = getFloat(A,None,"area")
+        E = getFloat(E,None,"Young's Modulus")
+        D = getFloat(D,0,"density")
+        if E is None or E <= 0:
+            raise ValueError("Young's Modulus must be positive")
+        if A is None or A <= 0:
+            raise ValueError("Area must be positive")
+        self.materials[num] = FEALinkMaterial.Material(num,E,A,D)
+        self.addNumber('materials',num)
+        for linkNum,link in self.links.items(): # links of a replaced material take the new one
+            if link.material.number == num:
+                link.material = self.materials[num]
+                self.editedLinks.add(linkNum)
+        return
+
+    def deleteMaterials(self,numbers):
+        used = set(link.material.number for link in self.links.values())
+        for num in numbers:
+            if num not in self.materials:
+                raise ValueError("Material %d does not exist" % num)
+            if num in used:
+                raise ValueError("Material %d is used in a link" % num)
+            del self.materials[num]
+            self.highest['materials'] = None
+        return
+
+#---Nodes---
+    def newNode(self,command): # number and coordinates, an existing number moves that node
+        command = fillCommand(command,1+self.dimensions)
+        num = getInteger(command[0],self.getNextNumber('nodes'),"Node number")
+        position = tuple(getFloat(x,None,"coordinate") for x in command[1:])
+        if None in position:
+            raise ValueError("Node requires %d coordinates" % self.dimensions)
+        if self.grid.find(position,ignore=num) is not None:
+            raise ValueError("Node exists in that location")
+
+        if num in self.nodes:
+            node = self.nodes[num]
+            node.x,node.y = position[:2]
+            if self.dimensions == 3:
+                node.z = position[2]
+            self.editedLinks.update(node.getLinks())
+        else:
+            self.nodes[num] = FEALinkNode.Node(num,*position,store=self.nodeStore)
+            self.addNumber('nodes',num)
+            self.structureEdited = True
+        self.grid.remove(num)
+        self.grid.add(num,position)
+        return
+
+    def deleteNodes(self,numbers):
+        for num in numbers:
+            if num not in self.nodes:
+                raise ValueError("Node %d does not exist" % num)
+            if self.nodes[num].isLinked():
+                raise ValueError("Cannot delete linked node %d" % num)
+            self.grid.remove(num)
+            self.nodes.pop(num).release()
+            self.highest['nodes'] = None
+        self.structureEdited = True
+        return
+
+    def linNode(self,command): # first number, count, number spacing, then start and end of each coordinate
+        command = fillCommand(command,3+2*self.dimensions)
+        startNum = getInteger(command[0],self.getNextNumber('nodes'),"Node number")
+        numNodes = getInteger(command[1],None,"Number of nodes")
+        spacing = getInteger(command[2],1,"Node spacing")
+        if numNodes is None or numNodes < 1:
+            raise ValueError("Number of nodes must be positive")
+        nodeNums = [startNum+i*spacing for i in range(numNodes)]
+        if any(num in self.nodes for num in nodeNums):
+            raise ValueError("One or more nodes already exist")
+
+        coordinates = list()
+        for k in range(self.dimensions):
+            start = getFloat(command[3+2*k],None,"start coordinate")
+            if start is None:
+                raise ValueError("Start coordinates are required")
+            end = getFloat(command[4+2*k],start,"end coordinate")
+            coordinates.append(np.linspace(start,end,numNodes).tolist())
+        positions = list(zip(*coordinates))
+        newGrid = FEALinkNode.NodeGrid(dimensions=self.dimensions,tolerance=self.grid.tolerance)
+        for num,position in zip(nodeNums,positions):
+            if self.grid.find(position) is not None or newGrid.find(position) is not None:
+                raise ValueError("Node overlaps existing node location")
+            newGrid.add(num,position)
+
+        for num,position in zip(nodeNums,positions):
+            self.nodes[num] = FEALinkNode.Node(num,*position,store=self.nodeStore)
+            self.grid.add(num,position)
+            self.addNumber('nodes',num)
+        self.structureEdited = True
+        return
+
+#---Links---
+    def newLink(self,command): # number, both nodes and material
+        num,node1,node2,mat = fillCommand(command,4)
+        num = getInteger(num,self.getNextNumber('links'),"Link number")
+        try:
+            node1 = self.nodes[int(node1)]
+            node2 = self.nodes[int(node2)]
+        except (ValueError,KeyError):
+            raise ValueError("Invalid node number")
+        if node1 is node2:
+            raise ValueError("Cannot link node to itself")
+        material = self.materials.get(getInteger(mat,0,"Material number"))
+        if material is None:
+            raise ValueError("Invalid material")
+        if num in self.links:
+            raise ValueError("Link number already exists")
+        if not node1.linkToNode(node2.number,num):
+            raise ValueError("Nodes already linked")
+        node2.linkToNode(node1.number,num)
+        self.links[num] = FEALinkLink.Link(num,node1,node2,material)
+        self.addNumber('links',num)
+        self.editedLinks.add(num)
+        return
+
+    def deleteLinks(self,numbers):
+        for num in numbers:
+            if num not in self.links:
+                raise ValueError("Link %d does not exist" % num)
+            link = self.links.pop(num)
+            link.release()
+            self.highest['links'] = None
+            link.node1.disconnectFromNode(link.node2.number)
+            link.node2.disconnectFromNode(link.node1.number)
+            self.editedLinks.add(num)
+        return
+
+    def multiLink(self,command): # first link, node range, material, node spacing and link spacing
+        startLink,lower,upper,mat,nodeSpacing,linkSpacing = fillCommand(command,6)
+        if not self.nodes:
+            raise ValueError("No nodes exist")
+        lower = getInteger(lower,0,"Node boundary")
+        upper = getInteger(upper,self.getNextNumber('nodes')-1,"Node boundary")
+        nodeSpacing = getInteger(nodeSpacing,1,"Node spacing")
+        if nodeSpacing == 0:
+            raise ValueError("Node spacing must be non-zero")
+        material = self.materials.get(getInteger(mat,0,"Material number"))
+        if material is None:
+            raise ValueError("Invalid material number")
+        linkNum = getInteger(startLink,self.getNextNumber('links'),"Link number")
+        linkSpacing = getInteger(linkSpacing,1,"Link spacing")
+
+        pairs = list()
+        for nodeNum in range(lower,(upper+1)-nodeSpacing):
+            if nodeNum in self.nodes and nodeNum+nodeSpacing in self.nodes and nodeNum+nodeSpacing not in self.nodes[nodeNum].linkedNodes:
+                if linkNum in self.links:
+                    raise ValueError("Link number to be created already exists")
+                pairs.append((linkNum,self.nodes[nodeNum],self.nodes[nodeNum+nodeSpacing]))
+                linkNum += linkSpacing
+        for num,node1,node2 in pairs:
+            node1.linkToNode(node2.number,num)
+            node2.linkToNode(node1.number,num)
+            self.links[num] = FEALinkLink.Link(num,node1,node2,material)
+            self.addNumber('links',num)
+            self.editedLinks.add(num)
+        return
+
+#---Constraints and Forces---
+    def getNode(self,value):
+        num = getInteger(value,None,"Node number")
+        if num not in self.nodes:
+            raise ValueError("Node number not defined")
+        return self.nodes[num]
+
+    def addConstraint(self,command): # node number and the displacement of each constrained direction
+        command = fillCommand(command,1+self.dimensions)
+        node = self.getNode(command[0])
+        node.addConstraints(*[getFloat(x,None,"constraint") for x in command[1:]])
+        self.structureEdited = True
+        return
+
+    def deleteConstraints(self,numbers):
+        for num in numbers:
+            node = self.getNode(str(num))
+            if not node.isConstrained():
+                raise ValueError("No constraints at node %d to delete" % num)
+            node.deleteConstraints()
+        self.structureEdited = True
+        return
+
+    def addForce(self,command): # node number and force components
+        command = fillCommand(command,1+self.dimensions)
+        node = self.getNode(command[0])
+        node.addForce(*[getFloat(x,0,"force") for x in command[1:]])
+        return
+
+    def deleteForces(self,numbers):
+        for num in numbers:
+            node = self.getNode(str(num))
+            if not node.hasForce():
+                raise ValueError("No forces at node %d to delete" % num)
+            node.deleteForce()
+        return
+
+#---Load Cases---
+    def addLoadCase(self,command):
+        if len(command) != 1 or command[0] == "":
+            raise ValueError("Load case requires a single name")
+        case = dict()
+        for num,node in self.nodes.items():
+            if node.hasForce():
+                case[num] = [getattr(node,a+'force') for a in ['x','y','z'][:self.dimensions]]
+        self.loadCases[command[0]] = case
+        self.structureEdited = True
+        return
+
+    def deleteLoadCases(self,names):
+        for name in names:
+            if name not in self.loadCases:
+                raise ValueError("Load case " + name + " does not exist")
+            del self.loadCases[name]
+        self.structureEdited = True
+        return
+
+    def useLoadCase(self,command):
+        if len(command) != 1 or command[0] not in self.loadCases:
+            raise ValueError("Load case does not exist")
+        for num,node in self.nodes.items():
+            node.deleteForce()
+        for num,force in self.loadCases[command[0]].items():
+            if num in self.nodes:
+                self.nodes[num].addForce(*force)
+        return
+
+#---Committing---
+    def commit(self): # moves the edited objects into the model, the dictionaries stay the ones the solution holds
+        model = self.model
+        for target,edited in [(model._Materials,self.materials),(model._Nodes,self.nodes),(model._Links,self.links),
+                                (model._LoadCases,self.loadCases)]:
+            target.clear()
+            target.update(edited)
+        model._Scope.updateScope(model._Nodes)
+        model._NodeGrid = self.grid # matches the committed nodes, so the model does not rebuild it
+        model._NodeStore = self.nodeStore
+        model.markEdited(self.editedLinks,structure=self.structureEdited)
+        return
+
+    def finish(self,solver=None): # runs the solve and save commands on the committed model, returns their messages
+        model = self.model
+        messages = list()
+        for action,value in self.actions:
+            if action == 'solve':
+                if model.gui:
+                    message = model.solve(solver=value or solver)
+                else:
+                    message = model.solveModel(value or solver)
+                messages.append(message)
+            else:
+                if value is not None:
+                    model.name = value
+                if model.gui:
+                    model.root.title(model.name)
+                    model.save()
+                else:
+                    FEALinkFile.writeModelFile(model.name,model)
+                messages.append("saved as " + str(model.name))
+        return messages
+
+    def __init__(self,Model):
+        self.model = Model
+        self.dimensions = Model.dimensions
+        # copied together, so the links of the copy refer to the copied nodes and materials, and the nodes to the copied store
+        self.nodeStore,self.materials,self.nodes,self.links,self.loadCases = copy.deepcopy((Model._NodeStore,Model._Materials,Model._Nodes,
+                                                                                            Model._Links,Model._LoadCases))
+        self.grid = FEALinkNode.NodeGrid(self.nodes,self.dimensions) # node positions, for finding coincident nodes
+        self.highest = {'materials':None,'nodes':None,'links':None} # highest numbers, None until first needed
+        self.editedLinks = set()
+        self.structureEdited = False
+        self.actions = list() # solve and save commands, run after the edits are committed
+        self.errors = list()
+        self.commandCount = 0
+        return
+
+
+def main(arguments=None):
+    import FEALinkModel # imported here, as the model module imports this one
+    parser = argparse.ArgumentParser(description="Run FEALink command scripts without opening a window.")
+    parser.add_argument('scripts',nargs='+',help="command script files, run in order")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-d','--dimensions',type=int,choices=[2,3],default=2,help="dimensions of a new model")
+    group.add_argument('-m','--model',default=None,help="saved model to run the scripts on")
+    parser.add_argument('-o','--output',default=None,help="file the model is saved to after the scripts")
+    parser.add_argument('--solver',choices=FEALinkSolution.Solution._solvers,default=None,help="solver for solve commands without one")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.model is not None:
+        model = FEALinkModel.Model(load=True,filename=arguments.model,gui=False)
+    else:
+        model = FEALinkModel.Model(dimensions=arguments.dimensions,gui=False)
+    failed = False
+    for filename in arguments.scripts:
+        errors,messages = model.runScript(filename,arguments.solver)
+        for line in errors:
+            print('%s %s' % (filename,line))
+        for message in messages:
+            print('%s: %s' % (filename,message))
+            if message.startswith("Error") or message.startswith("Solve Failed"):
+                failed = True
+        if errors:
+            return 1
+    if arguments.output is not None:
+        model.name = arguments.output
+        FEALinkFile.writeModelFile(model.name,model)
+        print('saved as %s' % model.name)
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,56 +4,349 @@
 #
 # This module implements the Solution class
 
-import FEALinkModel
+import os
+import json
+import time
+import hashlib
+import numpy as np
 import FEALinkNode
 import FEALinkLink
-import numpy as np
+try:
+	import cPickle as pickle
+except:
+	import pickle
+from collections import OrderedDict
+try:
+	from collections.abc import Mapping
+except:
+	from collections import Mapping
+try:
+	import scipy.linalg as la
+	import scipy.sparse as sp
+	import scipy.sparse.linalg as spla
+	import scipy.sparse.csgraph as csgraph
+except:
+	sp = None # sparse assembly is unavailable without scipy, the dense path is used instead
+try:
+	from sksparse.cholmod import cholesky as cholmod
+except:
+	cholmod = None # sparse cholesky falls back to SuperLU in symmetric mode
 
 class Solution(object):
+	_sparseThreshold = 300 # number of DOFs above which the stiffness matrix is assembled as a sparse matrix
+	_solvers = ['dense','lu','cholesky','cg'] # linear solver backends that can be passed to solve()
+	_calibrationFile = os.path.join(os.path.expanduser('~'),'.fealink_solvers.json') # written by calibrateSolvers()
+	_dispatchDefaults = {'denseMaxDofs':300,'directMaxFill':200000000} # used until a calibration exists
+	# directMaxFill is not calibrated, it bounds the memory of the factor (the envelope overestimates the real fill several times)
+	_reassemblyFraction = 0.2 # share of changed links above which K is assembled from scratch instead of patched
+	_rankCheckLimit = 2000 # largest 3D rigidity matrix (dofs + links) checked by a dense rank computation
+
+	def isConstrained(self): # checks that every connected part of the model is supported in each direction it is loaded
+		if self.connectivity is None: # cached by the model until nodes, links, constraints or forces change
+			self.connectivity = self.getConnectivity()
+		return len(self.connectivity['unsupported']) == 0
+
+	def getConnectivity(self): # connected components by union-find over the links, then loads and supports per component
+		d = self.dimensions
+		numbers = list(self._Nodes)
+		row = dict((num,k) for k,num in enumerate(numbers))
+		parent = list(range(len(numbers)))
+		size = [1]*len(numbers)
+		linked = [False]*len(numbers)
+
+		def find(k):
+			while parent[k] != k:
+				parent[k] = parent[parent[k]] # path halving
+				k = parent[k]
+			return k
+
+		for link in self._Links.values():
+			a,b = row[link.node1.number],row[link.node2.number]
+			linked[a] = linked[b] = True
+			a,b = find(a),find(b)
+			if a != b: # union by size
+				if size[a] < size[b]:
+					a,b = b,a
+				parent[b] = a
+				size[a] += size[b]
+		labels = np.array([find(k) for k in range(len(numbers))],dtype=int)
+
+		# loaded and supported directions of every node, the load cases count as loads too
+		coordinates,constraints,forces = FEALinkNode.getNodeArrays(self._Nodes,numbers,d)
+		loaded = forces != 0
+		supported = ~np.isnan(constraints)
+		for case in self._LoadCases.values():
+			for num,force in case.items():
+				if num in row:
+					loaded[row[num]] |= np.array(force[:d]) != 0
+
+		# a component fails if it is loaded in a direction none of its nodes is supported in
+		componentLoaded = np.zeros([len(numbers),d],dtype=bool)
+		componentSupported = np.zeros([len(numbers),d],dtype=bool)
+		np.logical_or.at(componentLoaded,labels,loaded)
+		np.logical_or.at(componentSupported,labels,supported)
+		failed = np.flatnonzero(np.any(componentLoaded & ~componentSupported,axis=1))
+
+		connectivity = dict()
+		connectivity['components'] = len(np.unique(labels))
+		connectivity['isolated'] = sorted([num for k,num in enumerate(numbers) if not linked[k]]) # nodes without links
+		connectivity['unsupported'] = [sorted([numbers[k] for k in np.flatnonzero(labels == label)]) for label in failed]
+		return connectivity
+
+	def checkModel(self,rigidity=True): # support and rigidity checks run before solving, returns the error or None
+		# Check constraint and force directions
+		if not self.isConstrained():
+			return "Error: Problem is insufficiently constrained, " + self.connectivityReport()
+
+		# Check for mechanisms before anything is factorized
+		if rigidity and not self.isStable():
+			return "Error: Unstable structure - check constraints, " + self.rigidityReport()
+		return None
+
+	def isStable(self): # rigidity analysis of the linked nodes, fills underBraced and redundantLinks
+		self.underBraced = list() # groups of node numbers that can move without stretching any link
+		self.redundantLinks = list() # link numbers not needed for rigidity (statically indeterminate)
+		active = sorted(set([link.node1.number for link in self._Links.values()] + [link.node2.number for link in self._Links.values()]))
+		if len(active) == 0:
+			return True # nodes without links are never solved for
+		if self.dimensions == 2:
+			self.getPebbleRigidity(active)
+		elif self.dimensions*len(active) + len(self._Links) <= self._rankCheckLimit:
+			self.getGenericRigidity(active)
+		else:
+			# no exact combinatorial test exists for 3D trusses, large models only get the counting check
+			c = sum([self._Nodes[num].numConstraints() for num in active])
+			if c + len(self._Links) < 3*len(active):
+				self.underBraced.append(active)
+		return len(self.underBraced) == 0
+
+	def getPebbleRigidity(self,active): # laman pebble game on the link graph plus a rigid ground triangle
+		# vertices 0-2 are ground, every constraint is a bar from its node to ground vertex 0 (x) or 1 (y)
+		vertex = dict((num,k+3) for k,num in enumerate(active))
+		edges = list() # (vertex,vertex,link number or None for constraints), constraints first
+		for num in active:
+			node = self._Nodes[num]
+			for axis,constraint in enumerate([node.xconstrain,node.yconstrain]):
+				if constraint is not None:
+					edges.append((vertex[num],axis,None))
+		for num,link in self._Links.items():
+			edges.append((vertex[link.node1.number],vertex[link.node2.number],num))
+		neighbors = [list() for k in range(len(active)+3)]
+		for u,v,num in edges:
+			neighbors[u].append((v,num))
+			neighbors[v].append((u,num))
+
+		# grow the cluster held by the ground, a vertex with two bars to it is held as well (henneberg steps)
+		# this settles triangulated trusses in linear time, only what is left goes through the pebble game
+		held = [False]*len(neighbors)
+		count = [2]*3 + [0]*len(active) # bars to held vertices, the ground starts out queued
+		queue = [0,1,2]
+		while queue:
+			x = queue.pop()
+			held[x] = True
+			used = 0
+			if x < 3:
+				used = 2 # ground vertices need no bars
+			for w,num in neighbors[x]:
+				if held[w]: # every edge is decided once, when its second vertex is held
+					if used < 2:
+						used += 1
+					elif num is not None:
+						self.redundantLinks.append(num)
+				else:
+					count[w] += 1
+					if count[w] == 2:
+						queue.append(w)
+		if all(held):
+			return
+
+		# the held cluster is replaced by a minimally rigid body over the ground and the vertices it shares with the rest
+		body = [k for k in range(len(neighbors)) if held[k] and (k < 3 or not all([held[w] for w,num in neighbors[k]]))]
+		loose = [k for k in range(len(neighbors)) if not held[k]]
+		index = dict((k,i) for i,k in enumerate(body+loose))
+		game = PebbleGame(len(index),2,3)
+		for u,v in [(0,1),(1,2),(0,2)]:
+			game.addEdge(u,v)
+		for i in range(3,len(body)):
+			game.addEdge(i,i-1)
+			game.addEdge(i,i-2)
+		for u,v,num in edges:
+			if held[u] and held[v]:
+				continue
+			if not game.addEdge(index[u],index[v]) and num is not None:
+				self.redundantLinks.append(num)
+		if game.independent == 2*len(index)-3:
+			return
+
+		# everything outside the cluster rigid with the ground is under-braced, grouped by its own rigid clusters
+		rigid = game.rigidComponent(0,1)
+		assigned = set(rigid)
+		number = dict((vertex[num],num) for num in active)
+		for u,v,num in edges:
+			if held[u] and held[v]:
+				continue
+			u,v = index[u],index[v]
+			if u in assigned or v in assigned or v not in game.adjacent[u]:
+				continue # redundant edges are never in the game's graph
+			cluster = game.rigidComponent(u,v) - rigid
+			assigned.update(cluster)
+			self.underBraced.append(sorted([number[(body+loose)[k]] for k in cluster]))
+		for k in loose:
+			if index[k] not in assigned:
+				self.underBraced.append([number[k]])
+		return
 
-	def isConstrained(self):
-		# check for forces and constraints in x-direction
-		hasXForce = False
-		isXConstrained = False
-		for num,node in self._Nodes.items():
-			if node.xforce != 0:
-				hasXForce = True
-			if node.xconstrain != None:
-				isXConstrained = True
-		if hasXForce and not isXConstrained: return False
-
-		# check y-direction
-		hasYForce = False
-		isYConstrained = False
-		for num,node in self._Nodes.items():
-			if node.yforce != 0:
-				hasYForce = True
-			if node.yconstrain != None:
-				isYConstrained = True
-		if hasYForce and not isYConstrained: return False
-
-		# check z-direction if 3D
-		if self.dimensions == 3:
-			hasZForce = False
-			for num,node in self._Nodes.items():
-				if node.zforce != 0:
-					hasZForce = True
-				if node.zconstrain != None:
-					isZConstrained = True
-			if hasZForce and not isZConstrained: return False
+	def getGenericRigidity(self,active): # rank of the rigidity matrix at random (generic) node positions
+		d = self.dimensions
+		index = dict((num,k) for k,num in enumerate(active))
+		position = np.random.RandomState(0).rand(len(active),d)
+		rows = list()
+		for num,link in self._Links.items():
+			i,j = index[link.node1.number],index[link.node2.number]
+			row = np.zeros(d*len(active))
+			row[d*i:d*(i+1)] = position[i]-position[j]
+			row[d*j:d*(j+1)] = position[j]-position[i]
+			rows.append(row)
+		for num in active:
+			node = self._Nodes[num]
+			for axis,constraint in enumerate([node.xconstrain,node.yconstrain,node.zconstrain]):
+				if constraint is not None:
+					row = np.zeros(d*len(active))
+					row[d*index[num]+axis] = 1
+					rows.append(row)
+		rigidity = np.array(rows)
+		U,sigma,Vt = np.linalg.svd(rigidity)
+		rank = np.sum(sigma > max(rigidity.shape)*np.finfo(float).eps*sigma.max())
+
+		# self stresses (left null vectors) load the redundant links, mechanisms (right null vectors) move nodes
+		stress = np.abs(U[:len(self._Links),rank:]).max(axis=1,initial=0)
+		self.redundantLinks = [num for k,num in enumerate(self._Links) if stress[k] > 1e-8]
+		motion = np.abs(Vt[rank:]).max(axis=0,initial=0).reshape([-1,d]).max(axis=1)
+		moving = set([num for k,num in enumerate(active) if motion[k] > 1e-8])
+		while moving: # group the moving nodes by the links between them
+			group = [moving.pop()]
+			for num in group:
+				for other in self._Nodes[num].linkedNodes:
+					if other in moving:
+						moving.remove(other)
+						group.append(other)
+			self.underBraced.append(sorted(group))
+		return
 
-		return True
+	def formatGroups(self,groups): # short listing of node groups for error messages
+		report = " ".join(["[" + ", ".join([str(num) for num in group[:6]]) + (", ..." if len(group) > 6 else "") + "]" for group in groups[:3]])
+		if len(groups) > 3:
+			report += " and %d more groups" % (len(groups)-3)
+		return report
+
+	def rigidityReport(self): # short description of the last rigidity analysis
+		return "under-braced nodes " + self.formatGroups(self.underBraced)
+
+	def connectivityReport(self): # short description of the last connectivity check
+		report = "loaded nodes without supports " + self.formatGroups(self.connectivity['unsupported'])
+		if len(self.connectivity['isolated']) > 0:
+			report += ", isolated nodes " + self.formatGroups([self.connectivity['isolated']])
+		return report
+
+	def getDofMap(self,permutation=None): # packs the user node numbers into contiguous equation numbers
+		self.nodeNumbers = np.array(sorted(self._Nodes),dtype=int) # node number of each equation block
+		if permutation is not None:
+			self.nodeNumbers = self.nodeNumbers[permutation]
+		self.nodeIndex = dict() # node number -> equation block, node i owns dofs d*i to d*i+d-1
+		for i,num in enumerate(self.nodeNumbers):
+			self.nodeIndex[num] = i
+		return
 
-	def isStable(self):
-		c = 0 # number of constraints
+	def getNodeGraph(self): # node adjacency from Node.linkedNodes, in natural (sorted) node order
+		natural = dict((num,i) for i,num in enumerate(sorted(self._Nodes)))
+		rows = list()
+		cols = list()
 		for num,node in self._Nodes.items():
-			c += node.numConstraints()
+			for other in node.linkedNodes:
+				rows.append(natural[num])
+				cols.append(natural[other])
+		n = len(natural)
+		return sp.csr_matrix((np.ones(len(rows)),(rows,cols)),shape=(n,n))
+
+	def reorderNodes(self): # bandwidth/fill reducing node order applied before assembly
+		ordering = self.ordering
+		if ordering == 'auto':
+			if self.solver in ['lu','cholesky']:
+				ordering = 'amd' # the factorization applies its own minimum degree ordering
+			elif self.solver == 'cg':
+				ordering = 'rcm' # a narrow band keeps the operator and preconditioner cache friendly
+			else:
+				ordering = 'natural'
+		if sp is None or (ordering == 'amd' and self.solver not in ['lu','cholesky']):
+			ordering = 'natural' # minimum degree ordering only happens inside the sparse factorizations
+		self.orderingUsed = ordering
+
+		if ordering == 'rcm':
+			self.graph = self.getNodeGraph()
+			self.nodePermutation = csgraph.reverse_cuthill_mckee(self.graph,symmetric_mode=True).astype(int)
+		else:
+			self.graph = None
+			self.nodePermutation = np.arange(len(self._Nodes))
+		self.getDofMap(self.nodePermutation)
+		return
+
+	def getProfile(self,position): # node bandwidth and profile of the link graph for new positions of the natural nodes
+		graph = sp.coo_matrix(self.graph)
+		rows = position[graph.row]
+		cols = position[graph.col]
+		if len(rows) == 0:
+			return 0,0
+		first = np.arange(len(position)) # first column of each row inside the envelope
+		np.minimum.at(first,rows,cols)
+		return int(np.abs(rows-cols).max()),int(np.sum(np.arange(len(position))-first))
+
+	def getOrderingStats(self,Kff): # before/after bandwidth and fill of the factorized system
+		d = self.dimensions
+		if self.graph is None:
+			self.graph = self.getNodeGraph()
 
-		n = len(self._Nodes) # number of nodes
-		l = len(self._Links) # number of links
+		# position of each natural node in the order the factorization actually uses
+		if self.orderingUsed == 'amd' and self.solver in ['lu','cholesky']:
+			if cholmod is not None and self.solver == 'cholesky':
+				dofOrder = self.factor.P()
+			else:
+				dofOrder = np.argsort(self.factor.perm_c)
+			blocks = self.free[dofOrder]//d
+			blocks = blocks[np.sort(np.unique(blocks,return_index=True)[1])]
+			order = np.concatenate([blocks,np.setdiff1d(np.arange(len(self.nodeNumbers)),blocks)])
+		else:
+			order = np.arange(len(self.nodeNumbers))
+		natural = self.nodePermutation[order] # natural node in each final position
+		position = np.zeros(len(natural),dtype=int)
+		position[natural] = np.arange(len(natural))
+
+		self.orderingStats = dict()
+		self.orderingStats['ordering'] = self.orderingUsed
+		before = self.getProfile(np.arange(len(natural)))
+		after = self.getProfile(position)
+		self.orderingStats['bandwidthBefore'] = before[0]
+		self.orderingStats['bandwidthAfter'] = after[0]
+		self.orderingStats['profileBefore'] = before[1]
+		self.orderingStats['profileAfter'] = after[1]
+		if Kff is not None and self.solver in ['lu','cholesky']:
+			Kff = sp.csc_matrix(Kff) # small models are assembled dense
+			self.orderingStats['nonzeros'] = Kff.nnz
+			if cholmod is not None and self.solver == 'cholesky':
+				self.orderingStats['factorNonzeros'] = self.factor.L().nnz
+			else:
+				self.orderingStats['factorNonzeros'] = self.factor.L.nnz + self.factor.U.nnz
+			self.orderingStats['fill'] = float(self.orderingStats['factorNonzeros'])/max(Kff.nnz,1)
+		return
 
-		if c+l >= self.dimensions*n: return True
-		else: return False
+	def orderingReport(self):
+		stats = self.orderingStats
+		if not stats:
+			return "No ordering statistics"
+		report = "%s ordering: node bandwidth %d -> %d, profile %d -> %d" % (stats['ordering'],
+					stats['bandwidthBefore'],stats['bandwidthAfter'],stats['profileBefore'],stats['profileAfter'])
+		if 'fill' in stats:
+			report += ", factor nonzeros %d (%.2f x K_ff)" % (stats['factorNonzeros'],stats['fill'])
+		return report
 
 	def getStiffnessMatrix(self):
 		# set up m x m matrix
@@ -63,8 +356,8 @@ class Solution(object):
 		d = self.dimensions
 		if d == 2: # 2D stiffness matrix
 			for num,link in self._Links.items():
-				i = link.node1.number
-				j = link.node2.number
+				i = self.nodeIndex[link.node1.number]
+				j = self.nodeIndex[link.node2.number]
 				stiffness = link.material.area * link.material.modulus / link.length # AE/L
 				blockii = stiffness * np.array([[link.cos**2       , link.cos*link.sin],
 												[link.cos*link.sin , link.sin**2      ]])
@@ -78,8 +371,8 @@ class Solution(object):
 				K[ d*j : d*(j+1) , d*j : d*(j+1)] += blockjj
 		else: # 3D stiffness matrix
 			for num,link in self._Links.items():
-				i = link.node1.number
-				j = link.node2.number
+				i = self.nodeIndex[link.node1.number]
+				j = self.nodeIndex[link.node2.number]
 				stiffness = link.material.area * link.material.modulus / link.length # AE/L
 				blockii = stiffness * np.array([[link.cosx**2        , link.cosx*link.cosy , link.cosx*link.cosz],
 												[link.cosx*link.cosy , link.cosy**2        , link.cosy*link.cosz],
@@ -95,207 +388,626 @@ class Solution(object):
 
 		return K
 
-	def getForceVector(self):
+	def getLinkArrays(self,linkNumbers=None,oldNumbers=None): # gathers link endpoints, AE/L and direction cosines into arrays in one pass
+		# with linkNumbers only those links are gathered again and appended, the rows of the other links are
+		# kept with their node rows moved from the numbering oldNumbers to the current one
+		d = self.dimensions
+		if linkNumbers is None:
+			links = list(self._Links.values())
+		else:
+			links = [self._Links[num] for num in linkNumbers if num in self._Links]
+		nodeIndex = self.nodeIndex
+		numbers = np.array([link.number for link in links],dtype=int) # link number of each row
+		ends = np.array([[nodeIndex[link.node1.number],nodeIndex[link.node2.number]] for link in links],dtype=int).reshape([-1,2])
+		area = np.array([link.material.area for link in links],dtype=float)
+		modulus = np.array([link.material.modulus for link in links],dtype=float)
+		# lengths and (cos,sin) in 2D, (cosx,cosy,cosz) in 3D, as kept by the link store until a node moves
+		points,lengths,cosines,midpoints = FEALinkLink.gatherLinkGeometry(links,d)
+		if linkNumbers is not None:
+			changed = set(linkNumbers)
+			kept = np.array([num not in changed for num in self.linkNumbers.tolist()],dtype=bool)
+			oldEnds = self.linkEnds[kept]
+			if oldNumbers is not None:
+				oldEnds = np.array([self.nodeIndex.get(num,-1) for num in oldNumbers],dtype=int)[oldEnds]
+			numbers = np.concatenate([self.linkNumbers[kept],numbers])
+			ends = np.concatenate([oldEnds,ends])
+			area = np.concatenate([self.linkArea[kept],area])
+			modulus = np.concatenate([self.linkModulus[kept],modulus])
+			lengths = np.concatenate([self.linkLengths[kept],lengths])
+			cosines = np.concatenate([self.linkCosines[kept],cosines])
+		self.linkNumbers,self.linkArea,self.linkModulus = numbers,area,modulus
+		stiffness = area*modulus/lengths # AE/L
+		self.linkEnds,self.linkStiffness,self.linkCosines = ends,stiffness,cosines # kept for low-rank updates
+		self.linkLengths = lengths
+		return ends,stiffness,cosines,lengths
+
+	def getSparseStiffnessMatrix(self):
+		ends,stiffness,cosines,lengths = self.getLinkArrays()
+		rows,cols,data = self.getStiffnessTriplets(ends,stiffness,cosines)
+		K = sp.coo_matrix((data,(rows,cols)),shape=(self.size,self.size)).tocsr()
+		return K
+
+	def getStiffnessTriplets(self,ends,stiffness,cosines): # COO entries of the link stiffness blocks
+		d = self.dimensions
+		# d x d block for every link: AE/L * c c^T
+		block = stiffness[:,np.newaxis,np.newaxis] * cosines[:,:,np.newaxis] * cosines[:,np.newaxis,:]
+
+		# global dofs of each link end, shape (links,d)
+		dofi = d*ends[:,0,np.newaxis] + np.arange(d)
+		dofj = d*ends[:,1,np.newaxis] + np.arange(d)
+
+		# COO triplets for the ii, ij, ji and jj blocks (duplicates are summed on conversion)
+		rows = np.concatenate([np.broadcast_to(a[:,:,np.newaxis],block.shape).ravel() for a in (dofi,dofi,dofj,dofj)])
+		cols = np.concatenate([np.broadcast_to(b[:,np.newaxis,:],block.shape).ravel() for b in (dofi,dofj,dofi,dofj)])
+		data = np.concatenate([block.ravel(),-block.ravel(),-block.ravel(),block.ravel()])
+		return rows,cols,data
+
+	def getStiffnessOperator(self): # matrix-free stiffness for the iterative solver
+		ends,stiffness,cosines,lengths = self.getLinkArrays()
+		return TrussOperator(ends,stiffness,cosines,self.size)
+
+	def getForceVector(self): # column 0 holds the nodal forces, the other columns the named load cases
 		# Go through each node and fill the force vector
-		F = np.zeros([self.size,1])
+		F = np.zeros([self.size,1+len(self.caseNames)])
 
 		d = self.dimensions
-		if d == 2:
-			for num,node in self._Nodes.items():
-				F[d*num] = node.xforce
-				F[d*num+1] = node.yforce
-		else:
-			for num,node in self._Nodes.items():
-				F[d*num] = node.xforce
-				F[d*num+1] = node.yforce
-				F[d*num+2] = node.zforce
+		coordinates,constraints,forces = FEALinkNode.getNodeArrays(self._Nodes,self.nodeNumbers.tolist(),d)
+		F[:,0] = forces.ravel() # node rows follow the equation numbering
+
+		# load cases map node number -> force components
+		for k,name in enumerate(self.caseNames):
+			for num,force in self._LoadCases[name].items():
+				if num in self.nodeIndex:
+					i = self.nodeIndex[num]
+					F[d*i:d*(i+1),k+1] = force
 
 		return F
 
-	def getDisplacement(self): # Uses the penalty method to get displacements
-		c = self.penaltyMultiplier; # penalty multiplier
+	def splitLoadCases(self): # separates the load case columns from the nodal force solution
+		self.caseF = self.F[:,1:]
+		self.caseU = self.U[:,1:]
+		self.caseR = self.R[:,1:]
+		self.F = self.F[:,:1]
+		self.U = self.U[:,:1]
+		self.R = self.R[:,:1]
+		self.getLoadCaseResults()
+		return
+
+	def getLoadCaseResults(self): # displacements, reactions and member forces for every load case
 		d = self.dimensions
+		self.loadCaseResults = dict()
+		if len(self.caseNames) == 0:
+			return
+
+		# node rows follow self.nodeNumbers, link rows follow self.linkNumbers
+		for k,name in enumerate(self.caseNames):
+			result = dict()
+			result['displacement'] = self.caseU[:,k].reshape([-1,d])
+			result['reaction'] = self.caseR[:,k].reshape([-1,d])
+			result['strain'] = self.getLinkStrain(self.caseU[:,k])
+			result['stress'] = self.linkModulus*result['strain']
+			result['tension'] = result['stress']*self.linkArea
+			self.loadCaseResults[name] = result
+		return
 
-		# set up penalty matrices
-		Fp = np.zeros_like(self.F)
-		Kp = np.zeros_like(self.K)
+	def getDisplacement(self): # partitions the dofs and solves K_ff*u_f = F_f - K_fp*u_p exactly
+		# split dofs into prescribed (constrained) and free ones
+		dofs,values = self.getConstrainedDofs()
+		diagonal = self.K.diagonal()
+		free = diagonal > 1e-12*np.max(np.abs(diagonal),initial=0) # dofs without stiffness keep 0 displacement, round-off of a patched K included
+		free[dofs] = False
+		self.free = np.flatnonzero(free)
+		self.prescribed = dofs
+
+		# one column per load column of F, all sharing the prescribed displacements
+		U = np.zeros(np.shape(self.F))
+		U[dofs,:] = values[:,np.newaxis]
+		if len(self.free) == 0:
+			return U
+
+		if self.solver == 'cg':
+			U[self.free,:] = self.getIterativeDisplacement(U)
+			if sp is not None:
+				self.getOrderingStats(None)
+			return U
+
+		# factorize the reduced system once and solve every load column against it in one call
+		Kff,self.Kfp = self.partitionStiffness()
+		self.factor = self.factorize(Kff)
+		if sp is not None and self.solver != 'dense':
+			self.getOrderingStats(Kff)
+		U[self.free] = self.factorSolve(self.getFreeLoad(U))
+		return U
 
-		# get penalty matrices
-		if d == 2:
-			for num,node in self._Nodes.items():
-				if node.xconstrain != None: 
-					rowMax = max(abs(self.K[d*num,:]))
-					Fp[d*num] = c*node.xconstrain*rowMax
-					Kp[d*num,d*num] = c*rowMax
+	def partitionStiffness(self): # returns the K_ff and K_fp blocks
+		if self.sparse:
+			Kf = self.K.tocsr()[self.free,:]
+			return Kf[:,self.free].tocsc(),Kf[:,self.prescribed].tocsr()
+		return self.K[np.ix_(self.free,self.free)],self.K[np.ix_(self.free,self.prescribed)]
 
-				if node.yconstrain != None: 
-					rowMax = max(abs(self.K[d*num+1,:]))
-					Fp[d*num+1] = c*node.yconstrain*rowMax
-					Kp[d*num+1,d*num+1] = c*rowMax
+	def getFreeLoad(self,U): # right hand side of the reduced system, F_f - K_fp*u_p
+		return self.F[self.free] - self.Kfp.dot(U[self.prescribed])
 
+	def getConstrainedDofs(self): # constrained dofs and their prescribed displacements
+		d = self.dimensions
+		coordinates,constraints,forces = FEALinkNode.getNodeArrays(self._Nodes,self.nodeNumbers.tolist(),d)
+		constraints = constraints.ravel()
+		dofs = np.flatnonzero(~np.isnan(constraints))
+		return dofs,constraints[dofs]
+
+	def getIterativeDisplacement(self,U): # preconditioned conjugate gradient on the free dofs, one run per load column
+		# prescribed dofs are masked out of the operator, so only K_ff is ever applied
+		free = np.zeros(self.size,dtype=bool)
+		free[self.free] = True
+
+		def A(p):
+			Ap = self.K.matvec(p)
+			Ap[~free] = 0
+			return Ap
+
+		# preconditioner, set up once for all load columns
+		if self.preconditioner == 'ichol':
+			if sp is None:
+				raise ValueError("the ichol preconditioner requires scipy")
+			# SuperLU's incomplete factorization in symmetric mode stands in for an incomplete cholesky
+			Kff = self.getSparseStiffnessMatrix()[free,:][:,free].tocsc()
+			ilu = spla.spilu(Kff,drop_tol=1e-4,fill_factor=10,permc_spec='MMD_AT_PLUS_A',diag_pivot_thresh=0.,
+							options=dict(SymmetricMode=True))
+			def M(r):
+				z = np.zeros_like(r)
+				z[free] = ilu.solve(r[free])
+				return z
+		else: # jacobi
+			inverse = np.zeros(self.size)
+			inverse[free] = 1/self.K.diagonal()[free]
+			def M(r):
+				return inverse*r
+
+		maxIterations = self.maxIterations
+		if maxIterations is None:
+			maxIterations = 10*self.size
+
+		# preconditioned conjugate gradient iterations for each column
+		X = np.zeros([len(self.free),np.shape(U)[1]])
+		self.caseIterations = list()
+		self.converged = True
+		self.residual = 0
+		for k in range(np.shape(U)[1]):
+			b = self.F[:,k] - self.K.matvec(U[:,k])
+			b[~free] = 0
+			x = np.zeros(self.size)
+			r = b.copy()
+			z = M(r)
+			p = z.copy()
+			rz = np.dot(r,z)
+			bnorm = np.linalg.norm(b)
+			if bnorm == 0:
+				bnorm = 1
+			history = [np.linalg.norm(r)/bnorm]
+			iterations = 0
+			while history[-1] > self.tolerance and iterations < maxIterations:
+				Ap = A(p)
+				alpha = rz/np.dot(p,Ap)
+				x += alpha*p
+				r -= alpha*Ap
+				iterations += 1
+				history.append(np.linalg.norm(r)/bnorm)
+				z = M(r)
+				rzNew = np.dot(r,z)
+				p = z + rzNew/rz*p
+				rz = rzNew
+
+			if not np.all(np.isfinite(x)):
+				raise np.linalg.LinAlgError("Singular matrix")
+			X[:,k] = x[free]
+			if k == 0: # the nodal force column is the one reported
+				self.iterations = iterations
+				self.residualHistory = history
+			self.caseIterations.append(iterations)
+			self.converged = self.converged and history[-1] <= self.tolerance
+			self.residual = max(self.residual,history[-1]) # worst relative residual reached
+
+		return X
+
+	def factorize(self,Kff): # factorizes the reduced stiffness matrix with the selected backend
+		if self.solver == 'dense':
+			if sp is not None and sp.issparse(Kff):
+				Kff = Kff.toarray()
+			if sp is None:
+				return Kff # without scipy the dense matrix is solved directly each time
+			return la.lu_factor(Kff,check_finite=False)
+
+		Kff = sp.csc_matrix(Kff)
+		natural = self.orderingUsed != 'amd' # otherwise keep the node order chosen in reorderNodes
+		if self.solver == 'cholesky':
+			if cholmod is not None: # raises if K_ff is not positive definite
+				if natural:
+					return cholmod(Kff,ordering_method='natural')
+				return cholmod(Kff)
+			# symmetric mode pivots on the diagonal, which is stable for the SPD K_ff
+			if natural:
+				permc = 'NATURAL'
+			else:
+				permc = 'MMD_AT_PLUS_A'
+			factor = spla.splu(Kff,permc_spec=permc,diag_pivot_thresh=0.,options=dict(SymmetricMode=True))
+		elif natural:
+			factor = spla.splu(Kff,permc_spec='NATURAL')
 		else:
-			for num,node in self._Nodes.items():
-				if node.xconstrain != None: 
-					rowMax = max(abs(self.K[d*num,:]))
-					Fp[d*num] = c*node.xconstrain*rowMax
-					Kp[d*num,d*num] = c*rowMax
-
-				if node.yconstrain != None: 
-					rowMax = max(abs(self.K[d*num+1,:]))
-					Fp[d*num+1] = c*node.yconstrain*rowMax
-					Kp[d*num+1,d*num+1] = c*rowMax
-
-				if node.zconstrain != None: 
-					rowMax = max(abs(self.K[d*num+2,:]))
-					Kp[d*num+2,d*num+2] = c*rowMax
-					Fp[d*num+2] = c*node.zconstrain*rowMax
-
-		self.Fp = Fp
-		self.Kp = Kp
-		# Solve for U (Kp*U = Fp)
-		Fp = Fp + self.F
-		Kp = Kp + self.K
-
-		# fill in diagonals in rows that have no term - these displacements will be 0
-		for i in range(0,self.size):
-			if np.count_nonzero(Kp[i,:]) == 0:
-				Kp[i,i] = 42 # the answer to the ultimate question of life, the universe, and everything (arbitrary #)
-
-		U = np.linalg.solve(Kp,Fp)
+			factor = spla.splu(Kff,permc_spec='COLAMD')
+
+		# SuperLU only fails on exactly zero pivots, so catch numerically singular matrices here
+		pivots = np.abs(factor.U.diagonal())
+		if pivots.min() <= Kff.shape[0]*np.finfo(float).eps*pivots.max():
+			raise np.linalg.LinAlgError("Singular matrix")
+		return factor
+
+	def factorSolve(self,b): # solves K_ff*u_f = b with the stored factor and any low-rank updates made since
+		U = self.baseSolve(b)
+		if self.updateRank > 0: # woodbury: (A + V C V^T)^-1 b = x - Z S^-1 V^T x with x = A^-1 b, Z = A^-1 V
+			U = U - self.updateZ.dot(np.linalg.solve(self.updateS,self.updateV.T.dot(U)))
 		return U
 
-	def getReactions(self):
-		R = np.dot(self.K,self.U)
-		return R
+	def baseSolve(self,b): # solves with the factor itself
+		if self.solver == 'dense':
+			if sp is None:
+				U = np.linalg.solve(self.factor,b)
+			else:
+				U = la.lu_solve(self.factor,b,check_finite=False)
+		elif self.solver == 'cholesky' and cholmod is not None:
+			U = self.factor(b)
+		else:
+			U = self.factor.solve(b)
+		U = np.asarray(U).reshape(np.shape(b))
 
-	def compileSolution(self):
-		d = self.dimensions
-		maxDisplacement = self.getMaxDisplacement()
-		# make solution nodes
-		for num,node in self._Nodes.items():
-			displacement = np.transpose(self.U[num*d:(num+1)*d])[0,:]
-			calculatedDisplacement = displacement
-			reaction = np.transpose(self.R[num*d:(num+1)*d])[0,:]
-			if node.xconstrain is not None:
-				displacement[0] = node.xconstrain
-			if node.yconstrain is not None:
-				displacement[1] = node.yconstrain
-			if d is 3 and node.zconstrain is not None:
-				displacement[2] = node.zconstrain
-			self._SolNodes[num] = NodeSolution(node,displacement,calculatedDisplacement,reaction,maxDisplacement,self.modelSize)
+		# singular matrices produce non-finite values instead of raising in some backends
+		if not np.all(np.isfinite(U)):
+			raise np.linalg.LinAlgError("Singular matrix")
+		return U
 
-		for num,link in self._Links.items():
-			solnode1 = self._SolNodes[link.node1.number]
-			solnode2 = self._SolNodes[link.node2.number]
-			self._SolLinks[num] = LinkSolution(num,solnode1,solnode2,link.material)
+	def restoreFactor(self): # refactorizes a kept stiffness matrix, as read back from the on-disk solution cache
+		if self.factor is None and self.solver != 'cg' and getattr(self,'K',None) is not None:
+			Kff,self.Kfp = self.partitionStiffness()
+			self.factor = self.factorize(Kff)
+		return self.factor is not None
+
+	def getLinkTerms(self,linkNumbers,sign=1): # rank one terms of the links as held in the link arrays
+		# every link is a term k*g*g^T of K, g holding -c at node1 and +c at node2, sign=-1 takes them out
+		rowOf = dict((num,row) for row,num in enumerate(self.linkNumbers.tolist()))
+		rows = np.array([rowOf[num] for num in linkNumbers if num in rowOf],dtype=int)
+		return self.linkEnds[rows],sign*self.linkStiffness[rows],self.linkCosines[rows]
+
+	def patchStiffness(self,ends,coefficients,cosines): # adds link blocks (negative coefficients subtract) to the stored K
+		rows,cols,data = self.getStiffnessTriplets(ends,coefficients,cosines)
+		if self.sparse:
+			self.K = (self.K + sp.coo_matrix((data,(rows,cols)),shape=(self.size,self.size))).tocsr()
+		else:
+			K = self.K.copy() # a new matrix, so the one before the patch can be put back
+			np.add.at(K,(rows,cols),data)
+			self.K = K
+		return
 
+	def remapStiffness(self,oldNumbers): # moves K from the old equation numbering to the current one
+		# blocks of removed nodes are dropped and new nodes start out without stiffness
+		d = self.dimensions
+		block = np.array([self.nodeIndex.get(num,-1) for num in oldNumbers],dtype=int)
+		dof = (d*block[:,np.newaxis] + np.arange(d)).ravel()
+		dof[np.repeat(block,d) < 0] = -1
+		kept = np.flatnonzero(dof >= 0)
+		if self.sparse:
+			K = self.K.tocoo()
+			keep = (dof[K.row] >= 0) & (dof[K.col] >= 0)
+			self.K = sp.coo_matrix((K.data[keep],(dof[K.row[keep]],dof[K.col[keep]])),shape=(self.size,self.size)).tocsr()
+		else:
+			K = np.zeros([self.size,self.size])
+			K[np.ix_(dof[kept],dof[kept])] = self.K[np.ix_(kept,kept)]
+			self.K = K
 		return
 
-	def getMaxDisplacement(self):
-		maxDisplacement = 0
-		d = int(self.dimensions)
+	def reassemble(self,linkNumbers): # re-solves after nodes, constraints or load cases changed, patching K for the changed links
+		# returns None when K is better assembled from scratch by a new Solution
+		size = len(self._Nodes)*self.dimensions
+		if self.solver == 'cg' or getattr(self,'K',None) is None:
+			return None
+		if self.sparse != (sp is not None and size > self._sparseThreshold):
+			return None
+		if len(linkNumbers) > self._reassemblyFraction*len(self._Links): # patching costs more than it saves
+			return None
+
+		# the patch makes new matrices and maps, the ones saved here come back unless the solve succeeds
+		state = self.__dict__.copy()
+		message = self.checkModel() # K and the equation numbering are only changed for a model that passes
+		if message is not None:
+			return self.keepIfSolved(state,message)
+
+		# take the changed links out in the old numbering, then move K over and put them back in
+		try:
+			self.patchStiffness(*self.getLinkTerms(linkNumbers,-1))
+			oldNumbers = self.nodeNumbers
+			self.size = size
+			self.caseNames = sorted(self._LoadCases)
+			self.reorderNodes()
+			self.remapStiffness(oldNumbers)
+			self.getLinkArrays(linkNumbers,oldNumbers)
+			self.patchStiffness(*self.getLinkTerms(linkNumbers))
+			message = self.solve(self.solver,assemble=False)
+		except:
+			message = "Solve Failed"
+		return self.keepIfSolved(state,message)
+
+	def keepIfSolved(self,state,message): # puts back the attributes saved before an in-place re-solve unless it succeeded
+		if message != "Success":
+			self.__dict__.clear()
+			self.__dict__.update(state)
+		return message
+
+	def updateLinks(self,linkNumbers): # re-solves after a few links were added, removed or changed, keeping the factor
+		if self.solver == 'cg' or not self.restoreFactor():
+			return self.solve(self.solver)
+		d = self.dimensions
 
-		if d == 2:
-			for i in range(0,int(self.size/d)):
-				disp = np.sqrt(self.U[i*d]**2 + self.U[i*d+1]**2)
-				maxDisplacement = max(maxDisplacement,disp)
+		for num in linkNumbers:
+			if num in self._Links and (self._Links[num].node1.number not in self.nodeIndex or self._Links[num].node2.number not in self.nodeIndex):
+				return self.solve(self.solver) # new nodes change the equation numbering
+
+		# removed or rewired links can leave a mechanism the update would not notice, added or changed ones cannot
+		rowOf = dict((num,row) for row,num in enumerate(self.linkNumbers.tolist()))
+		weakened = False
+		for num in linkNumbers:
+			if num in rowOf:
+				if num not in self._Links:
+					weakened = True
+				else:
+					link = self._Links[num]
+					ends = sorted([self.nodeIndex[link.node1.number],self.nodeIndex[link.node2.number]])
+					weakened = weakened or ends != sorted(self.linkEnds[rowOf[num]].tolist())
+		message = self.checkModel(weakened)
+		if message is not None:
+			return message
+
+		# the links come out as last assembled and go back in as they are now
+		removed = self.getLinkTerms(linkNumbers,-1)
+		self.getLinkArrays(linkNumbers)
+		current = self.getLinkTerms(linkNumbers)
+		ends = np.concatenate([removed[0],current[0]])
+		coefficients = np.concatenate([removed[1],current[1]])
+		cosines = np.concatenate([removed[2],current[2]])
+
+		if len(coefficients) == 0:
+			return self.resolve()
+		# K itself is patched with the changed blocks, it is still needed for K_fp and the reactions
+		self.patchStiffness(ends,coefficients,cosines)
+		rank = self.updateRank + len(coefficients)
+		if rank > self.maxUpdateRank: # too many changes for the update to pay off, so only K is refactorized
+			return self.solve(self.solver,assemble=False)
+
+		# links that leave a node without stiffness, or give one to a node that had none, change the free dofs
+		diagonal = self.K.diagonal()
+		free = diagonal > 1e-12*np.max(np.abs(diagonal))
+		free[self.prescribed] = False
+		if not np.array_equal(np.flatnonzero(free),self.free):
+			return self.solve(self.solver,assemble=False)
+
+		V = np.zeros([self.size,len(coefficients)])
+		column = np.arange(len(coefficients))
+		for k in range(d):
+			np.add.at(V,(d*ends[:,0]+k,column),-cosines[:,k])
+			np.add.at(V,(d*ends[:,1]+k,column),cosines[:,k])
+		if np.any(V[self.prescribed]): # a changed link touches a support, so K_fp changes too
+			if self.sparse:
+				self.Kfp = self.K[self.free,:][:,self.prescribed].tocsr()
+			else:
+				self.Kfp = self.K[np.ix_(self.free,self.prescribed)]
+		V = V[self.free]
+
+		try:
+			Z = self.baseSolve(V)
+		except:
+			return "Solve Failed"
+		if self.updateRank == 0:
+			self.updateV,self.updateZ,self.updateC = V,Z,coefficients
 		else:
-			for i in range(0,int(self.size/d)):
-				disp = np.sqrt(self.U[i*d]**2 + self.U[i*d+1]**2 + self.U[i*d+2]**2)
-				maxDisplacement = max(maxDisplacement,disp)
+			self.updateV = np.hstack([self.updateV,V])
+			self.updateZ = np.hstack([self.updateZ,Z])
+			self.updateC = np.concatenate([self.updateC,coefficients])
+		self.updateRank = rank
+		self.updateS = np.diag(1/self.updateC) + self.updateV.T.dot(self.updateZ) # capacitance matrix C^-1 + V^T Z
 
-		if maxDisplacement == 0: # to avoid /0 issues
-			maxDisplacement = 1
+		# a singular capacitance matrix means the edited structure is a mechanism, which a full solve reports
+		if np.linalg.cond(self.updateS) > 1e12:
+			return self.solve(self.solver,assemble=False)
 
-		return maxDisplacement
+		return self.resolve()
 
-	def constraintsMet(self):
+	def resolve(self): # re-solves for the current nodal forces and load cases, reusing the factorization
+		if not self.restoreFactor():
+			return self.solve(self.solver)
+		message = self.checkModel(False) # new loads need supports in their directions
+		if message is not None:
+			return message
+
+		try:
+			self.F = self.getForceVector()
+			U = np.repeat(self.U,np.shape(self.F)[1],axis=1) # keeps the prescribed displacements
+			U[self.free] = self.factorSolve(self.getFreeLoad(U))
+			self.U = U
+			self.R = self.getReactions()
+			self.splitLoadCases()
+		except:
+			return "Solve Failed"
+
+		self.compileSolution()
+		self.getStressStrain()
+		self.getMassProperties()
+		return "Success"
+
+	def getReactions(self): # K_pf*u_f + K_pp*u_p at supports, equal to the applied force elsewhere
+		R = self.K.dot(self.U)
+		return R
+
+	def compileSolution(self): # fills the columnar result store, _SolNodes and _SolLinks hand out views into it
 		d = self.dimensions
-		c = self.penaltyMultiplier
+		coordinates = FEALinkNode.getNodeArrays(self._Nodes,self.nodeNumbers.tolist(),d)[0] # undeformed positions in equation order
+		materials = [self._Links[num].material for num in self.linkNumbers]
+		results = SolutionResults(d,self.nodeNumbers,coordinates,self.linkNumbers,self.linkEnds,materials)
+
+		# U already holds the prescribed displacements at the constrained dofs
+		results.displacement = self.U[:,0].reshape([-1,d]).copy()
+		results.reaction = self.R[:,0].reshape([-1,d]).copy()
+		results.position = coordinates + results.displacement
+		results.exaggerated = coordinates + results.displacement/self.getMaxDisplacement()*.05*self.modelSize
+
+		self.results = results
+		self._SolNodes = ResultMapping(results,list(self._Nodes),results.nodeRow,NodeSolution)
+		self._SolLinks = ResultMapping(results,results.linkNumbers.tolist(),results.linkRow,LinkSolution)
+		return
 
-		# get maximum nodal displacement
-		maxDisp = 0
-		for num in self._Nodes:
-			disp = np.sqrt(sum(self.U[d*num:d*(num+1)]**2))
-			maxDisp = max(maxDisp,disp)
+	def convertLegacyResults(self): # rebuilds the result store of a solution saved with per-node and per-link objects
+		d = self.dimensions
+		# the old objects' attributes are hidden behind the view properties, so read them from __dict__
+		oldNodes = self.__dict__['_SolNodes']
+		oldLinks = self.__dict__['_SolLinks']
+		nodeNumbers = list(oldNodes)
+		nodes = [vars(oldNodes[num]) for num in nodeNumbers]
+		links = [vars(oldLinks[num]) for num in oldLinks]
+		nodeRow = dict((num,row) for row,num in enumerate(nodeNumbers))
+		linkEnds = np.array([[nodeRow[vars(link['node1'])['number']],nodeRow[vars(link['node2'])['number']]] for link in links],dtype=int)
+
+		displacement = np.array([np.ravel(node['displacement']) for node in nodes],dtype=float).reshape([-1,d])
+		position = np.array([np.ravel(node['position']) for node in nodes],dtype=float).reshape([-1,d])
+		results = SolutionResults(d,nodeNumbers,position-displacement,list(oldLinks),linkEnds.reshape([-1,2]),
+								[link['material'] for link in links])
+		results.displacement = displacement
+		results.reaction = np.array([np.ravel(node['reaction']) for node in nodes],dtype=float).reshape([-1,d])
+		results.position = position
+		results.exaggerated = np.array([np.ravel(node['exaggerated']) for node in nodes],dtype=float).reshape([-1,d])
+		results.strain = np.array([link.get('strain',0) for link in links],dtype=float)
+		results.stress = np.array([link.get('stress',0) for link in links],dtype=float)
+		results.tension = np.array([link.get('tension',0) for link in links],dtype=float)
+
+		self.results = results
+		self._SolNodes = ResultMapping(results,nodeNumbers,results.nodeRow,NodeSolution)
+		self._SolLinks = ResultMapping(results,list(oldLinks),results.linkRow,LinkSolution)
+		return
 
-		allowableError = maxDisp/c*2
+	def setModelSize(self,modelSize): # rescales the exaggerated deformation to a new plot size without re-solving
+		self.modelSize = modelSize
+		if self.results is not None:
+			self.results.exaggerated = self.results.coordinates + self.results.displacement/self.getMaxDisplacement()*.05*modelSize
+		return
 
-		# check that all constraints are within error tolerance
-		if d == 2:
-			for num,node in self._Nodes.items():
-				if node.xconstrain is not None and np.abs(node.xconstrain-self.U[num*d]) > allowableError: return False
-				if node.yconstrain is not None and np.abs(node.yconstrain-self.U[num*d+1]) > allowableError: return False
-		else:
-			for num,node in self._Nodes.items():
-				if node.xconstrain is not None and np.abs(node.xconstrain-self.U[num*d]) > allowableError: return False
-				if node.yconstrain is not None and np.abs(node.yconstrain-self.U[num*d+1]) > allowableError: return False
-				if node.zconstrain is not None and np.abs(node.zconstrain-self.U[num*d+2]) > allowableError: return False
+	def getMaxDisplacement(self):
+		d = int(self.dimensions)
+		maxDisplacement = np.max(np.sqrt(np.sum(self.U[:,0].reshape([-1,d])**2,axis=1)),initial=0)
+		if maxDisplacement == 0: # to avoid /0 issues
+			maxDisplacement = 1
+		return maxDisplacement
 
-		return True
+	def getLinkStrain(self,U): # small-strain axial strain (du.e)/L of every link, rows follow self.linkNumbers
+		U = np.reshape(U,[-1,self.dimensions])
+		elongation = np.sum((U[self.linkEnds[:,1]]-U[self.linkEnds[:,0]])*self.linkCosines,axis=1)
+		return elongation/self.linkLengths
 
 	def getStressStrain(self):
-		self.maxStrain = 0
-		self.minStrain = 0
-		self.maxStress = 0
-		self.minStress = 0
-		self.minTension = 0
-		self.maxTension = 0
-		for num,solLink in self._SolLinks.items():
-			li = self._Links[num].length
-			lf = self._SolLinks[num].length
-			strain = (lf-li)/li
-			solLink.addStrain(strain)
-			stress = solLink.stress # stress is calculated when strain is given
-			tension = solLink.tension
-
-			self.maxStrain = max(self.maxStrain,strain)
-			self.minStrain = min(self.minStrain,strain)
-			self.maxStress = max(self.maxStress,stress)
-			self.minStress = min(self.minStress,stress)
-			self.maxTension = max(self.maxTension,tension)
-			self.minTension = min(self.minTension,tension)
+		# projecting the end displacements avoids subtracting two nearly equal deformed lengths
+		results = self.results
+		results.strain = self.getLinkStrain(self.U[:,0])
+		results.stress = self.linkModulus*results.strain
+		results.tension = results.stress*self.linkArea
+
+		# the extremes include 0, as an all tension model still has minStress = 0
+		self.maxStrain = np.max(results.strain,initial=0)
+		self.minStrain = np.min(results.strain,initial=0)
+		self.maxStress = np.max(results.stress,initial=0)
+		self.minStress = np.min(results.stress,initial=0)
+		self.maxTension = np.max(results.tension,initial=0)
+		self.minTension = np.min(results.tension,initial=0)
 		return
 
 	def getMassProperties(self):
-		self._Length = dict()
-		self._Mass = dict()
-		self.totalMass = 0
-		self.totalLength = 0
-		for num,link in self._Links.items():
-			matNum = link.material.number
-			area = link.material.area
-			density = link.material.density
-			mass = link.length*area*density
-			if matNum not in self._Length:
-				self._Length[matNum] = link.length
-				self._Mass[matNum] = mass
-			else:
-				self._Length[matNum] += link.length
-				self._Mass[matNum] += mass
-			self.totalLength += link.length
-			self.totalMass += mass
+		links = list(self._Links.values())
+		materials = [link.material for link in links]
+		lengths = FEALinkLink.gatherLinkGeometry(links,self.dimensions)[1]
+		mass = lengths*np.array([m.area for m in materials],dtype=float)*np.array([m.density for m in materials],dtype=float)
+		# bincount adds up in link order, as the totals below do
+		matNums,group = np.unique(np.array([m.number for m in materials],dtype=int),return_inverse=True)
+		self._Length = dict(zip(matNums.tolist(),np.bincount(group,lengths,len(matNums)).tolist()))
+		self._Mass = dict(zip(matNums.tolist(),np.bincount(group,mass,len(matNums)).tolist()))
+		self.totalLength = sum(lengths.tolist())
+		self.totalMass = sum(mass.tolist())
 		return
 
 
-	def solve(self):
-		# Check constraint and force directions
-		if not self.isConstrained():
-			return "Error: Problem is insufficiently constrained"
-
-		# Check for instability
-		if not self.isStable():
-			return "Error: Unstable structure - check constraints"
+	def chooseSolver(self): # picks a backend from the model size and the calibrated timings, recording why
+		thresholds = loadCalibration()
+		d = self.dimensions
+		nonzeros = d*d*(len(self._Nodes) + 2*len(self._Links)) # nonzeros of K, counting every link block once
+		if sp is None:
+			solver = 'dense'
+			reason = "%d dofs, sparse backends need scipy" % self.size
+		elif self.size <= thresholds['denseMaxDofs']:
+			solver = 'dense'
+			reason = "%d dofs, dense up to %d" % (self.size,thresholds['denseMaxDofs'])
+		else:
+			fill = estimateFactorSize(self.getNodeGraph(),d)
+			if fill > thresholds['directMaxFill']: # the factor would not fit in memory
+				solver = 'cg'
+				reason = "%d dofs, estimated factor %d over the %d entry limit" % (self.size,fill,thresholds['directMaxFill'])
+			elif 'directTime' in thresholds and 'cgTime' in thresholds:
+				# the direct solver costs grow with the fill, cg with the nonzeros times the iterations
+				direct = predictTime(thresholds['directTime'],fill)
+				iterative = predictTime(thresholds['cgTime'],nonzeros)
+				if direct <= iterative:
+					solver = 'cholesky'
+				else:
+					solver = 'cg'
+				reason = "%d dofs, %d nonzeros, estimated factor %d, predicted %.3g s direct and %.3g s cg" % (self.size,nonzeros,fill,direct,iterative)
+			else:
+				solver = 'cholesky'
+				reason = "%d dofs, %d nonzeros, estimated factor %d within %d, not calibrated" % (self.size,nonzeros,fill,thresholds['directMaxFill'])
+		self.solverChoice = solver
+		self.solverReason = reason
+		return solver
+
+	def solve(self,solver=None,assemble=True): # assemble=False keeps a K that was already brought up to date
+		# pick the linear solver backend
+		if solver is None or solver == 'auto':
+			solver = self.chooseSolver()
+		elif solver != self.solverChoice: # re-solves keep the reason of the original choice
+			self.solverChoice = solver
+			self.solverReason = "requested"
+		if solver not in self._solvers:
+			return "Error: Unknown solver '" + str(solver) + "'"
+		if solver not in ['dense','cg'] and sp is None:
+			return "Error: The " + solver + " solver requires scipy"
+		self.solver = solver
+		if self.ordering not in ['auto','natural','rcm','amd']:
+			return "Error: Unknown ordering '" + str(self.ordering) + "'"
+
+		message = self.checkModel()
+		if message is not None:
+			return message
 
 		try:
-			# create stiffness matrix
-			self.K = self.getStiffnessMatrix()
-			# create force vector (input forces only, not reactions)
+			self.updateRank = 0 # a fresh factorization absorbs any earlier low-rank updates
+			if assemble: # otherwise K and the link arrays were already patched for the edited links
+				# number the equations in a bandwidth/fill reducing order
+				self.reorderNodes()
+				# create stiffness matrix (the iterative solver never forms it)
+				if self.solver == 'cg':
+					self.K = self.getStiffnessOperator()
+				elif self.sparse:
+					self.K = self.getSparseStiffnessMatrix()
+				else:
+					self.K = self.getStiffnessMatrix()
+					self.getLinkArrays() # link data for later low-rank updates
+			# create force vectors (input forces only, not reactions), one column per load case
 			self.F = self.getForceVector()
-			# Solve for displacement with penalty method
+			# Solve for displacement of the free dofs
 			self.U = self.getDisplacement()
-			# Use displacement from penalty method to get reaction forces
+			# Use the full displacement vector to get reaction forces
 			self.R = self.getReactions()
+			# keep the nodal force solution in U, R and F and the load cases separately
+			self.splitLoadCases()
 		except:
 			return "Solve Failed"
 
@@ -305,23 +1017,199 @@ class Solution(object):
 		# Solve for stress and strain
 		self.getStressStrain()
 
-		# perform checks to ensure adherance to boudary conditions
-		if not self.constraintsMet():
-			return "Warning: Solution did not meet the constraints"
+		if self.solver == 'cg' and not self.converged:
+			return "Warning: Iterative solver did not converge (residual %.3g after %d iterations)" % (self.residual,self.iterations)
 
 		self.getMassProperties()
 
 		return "Success"
 
+	def __getstate__(self): # factorizations cannot be pickled, so a saved solution refactorizes on its next solve
+		state = self.__dict__.copy()
+		state['factor'] = None
+		state['updateRank'] = 0
+		for key in ['K','Kfp','updateV','updateZ','updateC','updateS']: # matrices are rebuilt by the next solve
+			state.pop(key,None)
+		return state
+
 	def __init__(self,Model):
 		self.dimensions = Model.dimensions
 		self._Nodes = Model._Nodes
 		self._Links = Model._Links
-		self.size = (max(self._Nodes)+1)*self.dimensions
-		self.penaltyMultiplier = 1e6
-		self._SolNodes = dict()
-		self._SolLinks = dict()
+		self._LoadCases = Model._LoadCases # load case name -> {node number: force components}
+		self.caseNames = sorted(self._LoadCases)
+		self.loadCaseResults = dict()
+		self.connectivity = Model._Connectivity # connectivity check, kept by the model between solves
+		self.getDofMap()
+		self.size = len(self.nodeNumbers)*self.dimensions
+		self.sparse = sp is not None and self.size > self._sparseThreshold # dense matrices are kept for tiny models
+		self.solver = None
+		self.solverChoice = None # backend picked by solve(), with the reason in solverReason
+		self.solverReason = ""
+		self.factor = None # factorization of K_ff, reused by resolve()
+		self.updateRank = 0 # number of rank one link terms applied on top of the factor by updateLinks()
+		self.maxUpdateRank = 32 # beyond this updateLinks() refactorizes instead
+		self.preconditioner = 'jacobi' # 'jacobi' or 'ichol', used by the cg solver
+		self.tolerance = 1e-10 # relative residual the cg solver iterates to
+		self.maxIterations = None # cg iteration limit, defaults to 10 times the number of dofs
+		self.iterations = 0
+		self.residualHistory = list()
+		self.ordering = 'auto' # 'natural', 'rcm' (reverse cuthill-mckee) or 'amd' (approximate minimum degree)
+		self.orderingUsed = 'natural'
+		self.orderingStats = dict()
+		self.results = None # SolutionResults of the last solve
+		self._SolNodes = dict() # node number -> NodeSolution view, filled by compileSolution()
+		self._SolLinks = dict() # link number -> LinkSolution view
 		self.modelSize = Model._Scope.modelSize
+		self.modelHash = None # getModelHash() of the model state this solution belongs to, set by the model
+
+
+class TrussOperator(object):
+	# matrix-free stiffness operator, K*u is gathered and scattered directly over the link endpoint arrays
+	def matvec(self,u):
+		u = np.ravel(u)
+		elongation = np.sum((u[self.dofj]-u[self.dofi])*self.cosines,axis=1)
+		force = (self.stiffness*elongation)[:,np.newaxis]*self.cosines # axial force of each link along its axis
+		Ku = np.bincount(self.dofj.ravel(),force.ravel(),minlength=self.size)
+		Ku -= np.bincount(self.dofi.ravel(),force.ravel(),minlength=self.size)
+		return Ku
+
+	def dot(self,u): # same shape conventions as a matrix product
+		if np.ndim(u) == 2:
+			return np.column_stack([self.matvec(u[:,k]) for k in range(np.shape(u)[1])])
+		return self.matvec(u)
+
+	def diagonal(self):
+		block = self.stiffness[:,np.newaxis]*self.cosines**2
+		return np.bincount(self.dofi.ravel(),block.ravel(),minlength=self.size) + \
+				np.bincount(self.dofj.ravel(),block.ravel(),minlength=self.size)
+
+	def __init__(self,ends,stiffness,cosines,size):
+		d = np.shape(cosines)[1]
+		self.size = size
+		self.shape = (size,size)
+		self.stiffness = stiffness # AE/L of each link
+		self.cosines = cosines
+		self.dofi = d*ends[:,0,np.newaxis] + np.arange(d)
+		self.dofj = d*ends[:,1,np.newaxis] + np.arange(d)
+
+
+class PebbleGame(object):
+	# (k,l) pebble game, k = 2 and l = 3 decides generic rigidity of 2D bar frameworks (Laman's condition)
+	def findPebble(self,start,blocked,move=True): # depth first search along edge directions for a free pebble
+		visited = set(blocked)
+		visited.add(start)
+		parent = {start:None}
+		stack = [start]
+		while stack:
+			a = stack.pop()
+			for b in self.out[a]:
+				if b in visited:
+					continue
+				visited.add(b)
+				parent[b] = a
+				if self.pebbles[b] > 0:
+					if move: # reverse the path so the pebble ends up on start
+						self.pebbles[b] -= 1
+						self.pebbles[start] += 1
+						while parent[b] is not None:
+							a = parent[b]
+							self.out[a].remove(b)
+							self.out[b].append(a)
+							b = a
+					return True,visited
+				stack.append(b)
+		return False,visited
+
+	def gatherPebbles(self,u,v): # collects as many pebbles as possible on u and v
+		while self.pebbles[u] < self.k and self.findPebble(u,[v])[0]:
+			pass
+		while self.pebbles[v] < self.k and self.findPebble(v,[u])[0]:
+			pass
+		return self.pebbles[u] + self.pebbles[v]
+
+	def addEdge(self,u,v): # returns false if the edge is redundant
+		if self.gatherPebbles(u,v) <= self.l:
+			return False
+		self.pebbles[u] -= 1 # a pebble of u covers the edge, so it points from u to v
+		self.out[u].append(v)
+		self.adjacent[u].add(v)
+		self.adjacent[v].add(u)
+		self.independent += 1
+		return True
+
+	def rigidComponent(self,u,v): # vertices rigidly connected to the independent edge u-v
+		self.gatherPebbles(u,v) # l pebbles end up on u and v, all others are free to leave
+		rigid = set([u,v])
+		floppy = set()
+		queue = list(self.adjacent[u] | self.adjacent[v])
+		while queue:
+			w = queue.pop()
+			if w in rigid or w in floppy:
+				continue
+			if self.pebbles[w] > 0:
+				floppy.add(w)
+				continue
+			found,visited = self.findPebble(w,[u,v],move=False)
+			if found:
+				floppy.add(w)
+			else: # nothing reachable from w holds a free pebble, so all of it is rigid with u-v
+				for x in visited - rigid:
+					rigid.add(x)
+					queue.extend(self.adjacent[x])
+		return rigid
+
+	def __init__(self,numVertices,k,l):
+		self.k = k
+		self.l = l
+		self.pebbles = [k]*numVertices
+		self.out = [list() for i in range(numVertices)] # directed edges, each covered by a pebble of its tail
+		self.adjacent = [set() for i in range(numVertices)] # undirected neighbours over independent edges
+		self.independent = 0
+		return
+
+
+class SolutionResults(object):
+	# columnar result store, node rows follow nodeNumbers and link rows follow linkNumbers
+	def __init__(self,dimensions,nodeNumbers,coordinates,linkNumbers,linkEnds,materials):
+		self.dimensions = dimensions
+		self.nodeNumbers = np.array(nodeNumbers,dtype=int)
+		self.nodeRow = dict((num,row) for row,num in enumerate(self.nodeNumbers.tolist()))
+		self.coordinates = coordinates # undeformed positions, (nodes,d)
+		self.displacement = np.zeros(np.shape(coordinates))
+		self.reaction = np.zeros(np.shape(coordinates))
+		self.position = np.array(coordinates) # deformed positions
+		self.exaggerated = np.array(coordinates) # deformed positions with the displacement scaled up for plotting
+		self.linkNumbers = np.array(linkNumbers,dtype=int)
+		self.linkRow = dict((num,row) for row,num in enumerate(self.linkNumbers.tolist()))
+		self.linkEnds = linkEnds # node rows of both link ends, (links,2)
+		self.materials = materials # FEALinkMaterial.Material of each link
+		self.strain = np.zeros(len(self.linkNumbers))
+		self.stress = np.zeros(len(self.linkNumbers))
+		self.tension = np.zeros(len(self.linkNumbers))
+		return
+
+
+class ResultMapping(Mapping):
+	# read-only number -> view mapping over a SolutionResults store, views are made on access
+	def __getitem__(self,num):
+		return self.viewClass(self.results,self.rows[num])
+
+	def __contains__(self,num):
+		return num in self.rows
+
+	def __iter__(self):
+		return iter(self.numbers)
+
+	def __len__(self):
+		return len(self.numbers)
+
+	def __init__(self,results,numbers,rows,viewClass):
+		self.results = results
+		self.numbers = numbers # iteration order
+		self.rows = rows # number -> row of the result arrays
+		self.viewClass = viewClass
+		return
 
 
 class NodeSolution(object):
@@ -346,32 +1234,21 @@ class NodeSolution(object):
 				display.text(self.position[0],self.position[1],self.position[2],'%s' % str(self.number),size=11,zorder=1)
 		return
 
-	def __init__(self,node,displacement,calculatedDisplacement,reaction,maxDisplacement = 1,modelSize = 1):
-		self.number = node.number
-		self.dimensions = node.dimensions
-		self.reaction = reaction
-		self.displacement = displacement
-		self.calculatedDisplacement = calculatedDisplacement # keep track for stress solving purposes
-
-		maxExag = .05*modelSize
-
-		if self.dimensions == 2:
-			self.position = np.array([node.x,node.y]) + displacement
-			self.exaggerated = np.array([node.x,node.y]) + displacement/maxDisplacement*maxExag
-		else:
-			self.position = np.array([node.x,node.y,node.z]) + displacement
-			self.exaggerated = np.array([node.x,node.y,node.z]) + displacement/maxDisplacement*maxExag
-		self.linkedNodes = node.linkedNodes
+	number = property(lambda self: int(self._results.nodeNumbers[self._row]))
+	dimensions = property(lambda self: self._results.dimensions)
+	displacement = property(lambda self: self._results.displacement[self._row])
+	calculatedDisplacement = property(lambda self: self._results.displacement[self._row])
+	reaction = property(lambda self: self._results.reaction[self._row])
+	position = property(lambda self: self._results.position[self._row])
+	exaggerated = property(lambda self: self._results.exaggerated[self._row])
+
+	def __init__(self,results,row): # view of one node row of a SolutionResults store
+		self._results = results
+		self._row = row
 		return
 
 
 class LinkSolution(object):
-	def addStrain(self,strain):
-		self.strain = strain
-		self.stress = self.material.modulus * strain
-		self.tension = self.stress*self.material.area
-		return
-
 	def getColor(self,maxStress,minStress):
 		if maxStress == None:
 			colorCode = 'c'
@@ -411,23 +1288,253 @@ class LinkSolution(object):
 				display.text(self.xmid,self.ymid,self.zmid,'%s' % str(self.number),size=11,zorder=1,color=colorCode)
 		return
 
-	def __init__(self,num,solnode1,solnode2,material):
-		self.number = num
-		self.node1 = solnode1 # FEALinkNode.Node object
-		self.node2 = solnode2
-		self.material = material # FEALinkMaterial.Material object
-		self.dimensions = solnode1.dimensions
-		self.x = [solnode1.position[0],solnode2.position[0]]
-		self.xEx = [solnode1.exaggerated[0],solnode2.exaggerated[0]]
-		self.y = [solnode1.position[1],solnode2.position[1]]
-		self.yEx = [solnode1.exaggerated[1],solnode2.exaggerated[1]]
-		self.xmid = (.55*self.x[0]+.45*self.x[1])
-		self.ymid = (.55*self.y[0]+.45*self.y[1])
-		if self.dimensions == 2:
-			self.length = np.sqrt((self.x[0]-self.x[1])**2 + (self.y[0]-self.y[1])**2)
+	def ends(self,positions,k): # coordinate k of both link ends
+		return [positions[self._ends[0],k],positions[self._ends[1],k]]
+
+	def midpoint(self,k): # label position along the deformed link
+		x = self.ends(self._results.position,k)
+		return .55*x[0]+.45*x[1]
+
+	number = property(lambda self: int(self._results.linkNumbers[self._row]))
+	dimensions = property(lambda self: self._results.dimensions)
+	node1 = property(lambda self: NodeSolution(self._results,self._ends[0]))
+	node2 = property(lambda self: NodeSolution(self._results,self._ends[1]))
+	material = property(lambda self: self._results.materials[self._row])
+	strain = property(lambda self: self._results.strain[self._row])
+	stress = property(lambda self: self._results.stress[self._row])
+	tension = property(lambda self: self._results.tension[self._row])
+	x = property(lambda self: self.ends(self._results.position,0))
+	y = property(lambda self: self.ends(self._results.position,1))
+	z = property(lambda self: self.ends(self._results.position,2))
+	xEx = property(lambda self: self.ends(self._results.exaggerated,0))
+	yEx = property(lambda self: self.ends(self._results.exaggerated,1))
+	zEx = property(lambda self: self.ends(self._results.exaggerated,2))
+	xmid = property(lambda self: self.midpoint(0))
+	ymid = property(lambda self: self.midpoint(1))
+	zmid = property(lambda self: self.midpoint(2))
+
+	@property
+	def length(self): # deformed length
+		position = self._results.position
+		return np.sqrt(np.sum((position[self._ends[1]]-position[self._ends[0]])**2))
+
+	def __init__(self,results,row): # view of one link row of a SolutionResults store
+		self._results = results
+		self._row = row
+		self._ends = results.linkEnds[row]
+		return
+
+
+class SolutionCache(object):
+	# recently solved model states by content hash, in memory and optionally as files that outlive the session
+	directory = None # folder for the on-disk cache, None keeps solutions in memory only
+
+	def get(self,key,Model): # solution of the model state with this hash, or None
+		solution = self.solutions.pop(key,None)
+		if solution is not None and solution.modelHash != key: # updated in place for a later state since
+			solution = None
+		if solution is None and self.directory is not None:
+			solution = self.readSolution(key,Model)
+		if solution is not None:
+			self.solutions[key] = solution # most recently used entries are last
+		return solution
+
+	def put(self,solution):
+		self.solutions.pop(solution.modelHash,None)
+		self.solutions[solution.modelHash] = solution
+		while len(self.solutions) > self.maxEntries:
+			self.solutions.popitem(last=False)
+		if self.directory is not None:
+			self.writeSolution(solution)
+		return
+
+	def discard(self,solution): # drops the entries holding this solution, as after a failed in-place update of it
+		for key,cached in list(self.solutions.items()):
+			if cached is solution:
+				del self.solutions[key]
+		return
+
+	def getPath(self,key):
+		return os.path.join(self.directory,key + '.flsol')
+
+	def writeSolution(self,solution):
+		# factorizations cannot be pickled, the assembled matrix is kept so a later re-solve only refactorizes
+		state = solution.__getstate__()
+		for name in ['_Nodes','_Links','_LoadCases']: # belong to the model, rebound when read back
+			state.pop(name,None)
+		state['K'] = getattr(solution,'K',None)
+		path = self.getPath(solution.modelHash)
+		if os.path.exists(path): # the hash fixes the content, an existing entry is already up to date
+			return
+		try:
+			if not os.path.isdir(self.directory):
+				os.makedirs(self.directory)
+			with open(path,'wb') as file:
+				pickle.dump(state,file,pickle.HIGHEST_PROTOCOL)
+		except (IOError,OSError):
+			pass # the cache is only a shortcut, a failed write is not an error
+		return
+
+	def readSolution(self,key,Model):
+		try:
+			with open(self.getPath(key),'rb') as file:
+				state = pickle.load(file)
+		except Exception:
+			return None # missing or unreadable entries are solved again
+		solution = Solution.__new__(Solution)
+		solution.__dict__.update(state)
+		solution._Nodes = Model._Nodes
+		solution._Links = Model._Links
+		solution._LoadCases = Model._LoadCases
+		return solution
+
+	def __init__(self,maxEntries=8,directory=None):
+		self.maxEntries = maxEntries
+		self.solutions = OrderedDict() # hash -> Solution, least recently used first
+		if directory is not None:
+			self.directory = directory
+
+
+def getModelHash(Model): # hash over everything the solution depends on, equal for equal model states
+	# the node and link columns are hashed as arrays in number order, only the gathering loops run in python
+	d = Model.dimensions
+	digest = hashlib.sha1(repr(d).encode('utf-8'))
+	def add(values,dtype): # ints and floats of equal value, -0.0 and 0.0 and all nans hash the same
+		values = np.asarray(values,dtype=dtype)
+		if dtype == float:
+			values = np.where(np.isnan(values),np.nan,values) + 0.
+		digest.update(repr(values.shape).encode('utf-8'))
+		digest.update(np.ascontiguousarray(values).tobytes())
+	materials = sorted(Model._Materials)
+	add(materials,int)
+	add([[Model._Materials[num].modulus,Model._Materials[num].area,Model._Materials[num].density] for num in materials],float)
+	nodes = np.sort(np.fromiter(Model._Nodes,dtype=int,count=len(Model._Nodes))).tolist()
+	add(nodes,int)
+	for values in FEALinkNode.getNodeArrays(Model._Nodes,nodes,d): # coordinates, constraints (nan if free) and forces
+		add(values,float)
+	links = np.sort(np.fromiter(Model._Links,dtype=int,count=len(Model._Links))).tolist()
+	add(links,int)
+	links = [Model._Links[num] for num in links]
+	add([[link.node1.number,link.node2.number,link.material.number] for link in links],int)
+	for name in sorted(Model._LoadCases):
+		case = Model._LoadCases[name]
+		numbers = sorted(case)
+		digest.update(repr(name).encode('utf-8'))
+		add(numbers,int)
+		add([case[num] for num in numbers],float)
+	return digest.hexdigest()
+
+def estimateFactorSize(graph,d): # nonzeros of a cholesky factor inside the RCM envelope of the node graph
+	# the envelope bounds the fill of the minimum degree ordering the direct solvers use, and is cheap to find
+	n = graph.shape[0]
+	if n == 0:
+		return 0
+	position = np.zeros(n,dtype=int)
+	position[csgraph.reverse_cuthill_mckee(sp.csr_matrix(graph),symmetric_mode=True)] = np.arange(n)
+	graph = sp.coo_matrix(graph)
+	first = np.arange(n) # first column of each row inside the envelope
+	np.minimum.at(first,position[graph.row],position[graph.col])
+	return int(d*d*np.sum(np.arange(n)-first) + d*(d+1)//2*n)
+
+def loadCalibration(): # dispatch thresholds from the calibration file, or the defaults without one
+	global _calibration
+	if _calibration is None:
+		_calibration = dict(Solution._dispatchDefaults)
+		try:
+			with open(Solution._calibrationFile) as file:
+				_calibration.update(json.load(file))
+		except (IOError,ValueError):
+			pass
+	return _calibration
+
+_calibration = None
+
+def getCalibrationSolution(n): # braced n x n grid truss, fixed along one edge and loaded along the other
+	node = np.arange(n*n).reshape([n,n])
+	ends = list()
+	for a,b in [(node[:-1,:],node[1:,:]),(node[:,:-1],node[:,1:]),(node[:-1,:-1],node[1:,1:]),(node[:-1,1:],node[1:,:-1])]:
+		ends.append(np.column_stack([a.ravel(),b.ravel()]))
+	ends = np.concatenate(ends)
+	coordinates = np.column_stack([(node//n).ravel(),(node%n).ravel()]).astype(float)
+	delta = coordinates[ends[:,1]] - coordinates[ends[:,0]]
+	lengths = np.sqrt(np.sum(delta**2,axis=1))
+
+	solution = Solution.__new__(Solution) # no model, only what the backends use
+	solution.dimensions = 2
+	solution.size = 2*n*n
+	solution.tolerance = 1e-10
+	solution.maxIterations = None
+	solution.preconditioner = 'jacobi'
+	solution.orderingUsed = 'amd'
+	solution.updateRank = 0
+	solution.operator = TrussOperator(ends,1/lengths,delta/lengths[:,np.newaxis],solution.size)
+	rows,cols,data = solution.getStiffnessTriplets(ends,1/lengths,delta/lengths[:,np.newaxis])
+	solution.matrix = sp.coo_matrix((data,(rows,cols)),shape=(solution.size,solution.size)).tocsr()
+	solution.graph = sp.coo_matrix((np.ones(2*len(ends)),(np.concatenate([ends[:,0],ends[:,1]]),np.concatenate([ends[:,1],ends[:,0]]))),shape=(n*n,n*n))
+	solution.prescribed = np.arange(2*n)
+	solution.free = np.arange(2*n,solution.size)
+	solution.F = np.zeros([solution.size,1])
+	solution.F[-2*n+1::2] = -1
+	return solution
+
+def timeBackend(solution,solver,repeat=3): # best time of a factorization and solve, or of a cg run
+	solution.solver = solver
+	best = None
+	for k in range(repeat):
+		start = time.time()
+		if solver == 'cg':
+			solution.K = solution.operator
+			solution.getIterativeDisplacement(np.zeros([solution.size,1]))
 		else:
-			self.z = [solnode1.position[2],solnode2.position[2]]
-			self.zEx = [solnode1.exaggerated[2],solnode2.exaggerated[2]]
-			self.zmid = (.55*self.z[0]+.45*self.z[1])
-			self.length = np.sqrt((self.x[0]-self.x[1])**2 + (self.y[0]-self.y[1])**2 + (self.z[0]-self.z[1])**2)
-		return
\ No newline at end of file
+			Kff = solution.matrix[solution.free,:][:,solution.free].tocsc()
+			solution.factor = solution.factorize(Kff)
+			solution.factorSolve(solution.F[solution.free])
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def fitTime(sizes,times): # least squares fit of times = a*sizes^b on a log scale, returns [a,b]
+	b,loga = np.polyfit(np.log(sizes),np.log(times),1)
+	return [float(np.exp(loga)),float(b)]
+
+def predictTime(fit,size):
+	return fit[0]*size**fit[1]
+
+def calibrateSolvers(sizes=(4,6,8,11,16,22,32,45,64,90),filename=None): # times the backends on grid trusses and saves the dispatch data
+	# the sample trusses are too small for cg to overtake the direct solver, so rather than a crossover the
+	# timings are fitted against the estimated factor and the nonzeros, and the fits compared for each model
+	global _calibration
+	if sp is None:
+		raise ImportError("solver calibration requires scipy")
+	thresholds = dict(Solution._dispatchDefaults)
+	thresholds['measurements'] = list()
+	denseFaster = True
+	fitted = list() # measurements past the dense range, long enough to time reliably
+	for n in sizes:
+		solution = getCalibrationSolution(n)
+		measurement = {'dofs':solution.size,'factorEstimate':estimateFactorSize(solution.graph,2),
+						'nonzeros':4*(n*n + solution.graph.nnz)} # as counted in chooseSolver, the graph holds every link twice
+		if denseFaster:
+			measurement['dense'] = timeBackend(solution,'dense')
+		measurement['cholesky'] = timeBackend(solution,'cholesky')
+		measurement['cg'] = timeBackend(solution,'cg')
+		thresholds['measurements'].append(measurement)
+
+		# dense wins on small models
+		if denseFaster and measurement['dense'] <= measurement['cholesky']:
+			thresholds['denseMaxDofs'] = solution.size
+			continue
+		denseFaster = False
+		if min(measurement['cholesky'],measurement['cg']) >= 1e-3:
+			fitted.append(measurement)
+	if len(fitted) >= 2:
+		thresholds['directTime'] = fitTime([m['factorEstimate'] for m in fitted],[m['cholesky'] for m in fitted])
+		thresholds['cgTime'] = fitTime([m['nonzeros'] for m in fitted],[m['cg'] for m in fitted])
+
+	if filename is None:
+		filename = Solution._calibrationFile
+	with open(filename,'w') as file:
+		json.dump(thresholds,file,indent=1)
+	_calibration = None # reloaded by the next dispatch
+	return thresholds